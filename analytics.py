@@ -0,0 +1,184 @@
+"""Column-oriented analytics over the students table, vectorized with NumPy when it is installed.
+
+load() turns the student rows into columns once: marks as float64, Course_id and Grade as small integer
+codes (categorical) with a list of names per code. Group-by-course statistics, histograms, bucketing marks
+into letter grades and ranking then work on whole arrays instead of parsing "Marks" row by row.
+Without NumPy every function falls back to plain Python and returns the same results.
+
+    python analytics.py     # times these against storages.course_statistics / sort_students
+"""
+
+import bisect
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+import stats
+import storages as storage
+
+
+class Columns:
+    def __init__(self, rows: Iterable[dict]):
+        self.emails: List[str] = []
+        self.courses: List[str] = []          # code -> Course_id (first spelling seen)
+        self.grades: List[str] = []           # code -> Grade
+        course_codes: Dict[str, int] = {}
+        grade_codes: Dict[str, int] = {}
+        course, grade, marks = [], [], []
+        for r in rows:
+            m = stats.marks_of(r)
+            if m is None:
+                continue
+            c = r["Course_id"].lower()
+            if c not in course_codes:
+                course_codes[c] = len(self.courses)
+                self.courses.append(r["Course_id"])
+            if r["Grade"] not in grade_codes:
+                grade_codes[r["Grade"]] = len(self.grades)
+                self.grades.append(r["Grade"])
+            self.emails.append(r["Email_address"])
+            course.append(course_codes[c])
+            grade.append(grade_codes[r["Grade"]])
+            marks.append(m)
+        if np is not None:
+            self.course = np.array(course, dtype=np.int32)
+            self.grade = np.array(grade, dtype=np.int32)
+            self.marks = np.array(marks, dtype=np.float64)
+        else:
+            self.course, self.grade, self.marks = course, grade, marks
+
+    def __len__(self) -> int:
+        return len(self.emails)
+
+
+def load(rows: Optional[Iterable[dict]] = None) -> Columns:
+    return Columns(storage.backend().iter_rows("students") if rows is None else rows)
+
+
+# {Course_id: {"count", "average", "median", "stddev", "min", "max"}} for every course.
+def course_stats(cols: Columns) -> Dict[str, dict]:
+    if not len(cols):
+        return {}
+    if np is None:
+        groups: Dict[int, List[float]] = {}
+        for c, m in zip(cols.course, cols.marks):
+            groups.setdefault(c, []).append(m)
+        out = {}
+        for c, marks in groups.items():
+            marks.sort()
+            n = len(marks)
+            mean = sum(marks) / n
+            out[cols.courses[c]] = _summary(n, mean, math.sqrt(max(0.0, sum(m * m for m in marks) / n - mean * mean)),
+                                            _median(marks, 0, n), marks[0], marks[-1])
+        return out
+    # sort by course, then by marks: every course is one run of sorted marks
+    order = np.lexsort((cols.marks, cols.course))
+    marks = cols.marks[order]
+    counts = np.bincount(cols.course, minlength=len(cols.courses))
+    sums = np.bincount(cols.course, weights=cols.marks, minlength=len(cols.courses))
+    squares = np.bincount(cols.course, weights=cols.marks * cols.marks, minlength=len(cols.courses))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    means = sums / counts
+    stds = np.sqrt(np.maximum(0.0, squares / counts - means * means))
+    low = marks[starts + (counts - 1) // 2]
+    high = marks[starts + counts // 2]
+    medians = (low + high) / 2
+    return {cols.courses[c]: _summary(int(counts[c]), float(means[c]), float(stds[c]), float(medians[c]),
+                                      float(marks[starts[c]]), float(marks[starts[c] + counts[c] - 1]))
+            for c in range(len(cols.courses))}
+
+
+def _summary(n, mean, std, median, low, high) -> dict:
+    return {"count": n, "average": mean, "median": median, "stddev": std, "min": low, "max": high}
+
+
+def _median(ordered: List[float], start: int, n: int) -> float:
+    return (ordered[start + (n - 1) // 2] + ordered[start + n // 2]) / 2
+
+
+# Counts of marks in `bins` equal-width bins over [low, high] (the last bin includes high), and the bin edges.
+def histogram(cols: Columns, bins: int = 10, low: float = 0.0, high: float = 100.0) -> Tuple[List[int], List[float]]:
+    if np is not None:
+        counts, edges = np.histogram(cols.marks, bins=bins, range=(low, high))
+        return counts.tolist(), edges.tolist()
+    width = (high - low) / bins
+    counts = [0] * bins
+    for m in cols.marks:
+        if low <= m <= high:
+            counts[min(int((m - low) / width), bins - 1)] += 1
+    return counts, [low + i * width for i in range(bins + 1)]
+
+
+'''Grade boundaries come from grades.csv: Marks_range "90-100" means marks from 90, "<60" means everything below 60.
+They are returned as (lowest marks, grade) pairs sorted from the lowest boundary up.'''
+
+def grade_boundaries() -> List[Tuple[float, str]]:
+    bounds = []
+    for g in storage.backend().rows("grades"):
+        text = g["Marks_range"].strip()
+        try:
+            low = 0.0 if text.startswith("<") else float(text.split("-")[0])
+        except ValueError:
+            continue
+        bounds.append((low, g["Grade"]))
+    return sorted(bounds) or [(0.0, "F"), (60.0, "D"), (70.0, "C"), (80.0, "B"), (90.0, "A")]
+
+
+# Letter grade for every student's marks according to the boundaries, and how many students got each letter.
+def bucket(cols: Columns, boundaries: Optional[Sequence[Tuple[float, str]]] = None) -> Tuple[List[str], Dict[str, int]]:
+    boundaries = sorted(boundaries or grade_boundaries())
+    lows = [b[0] for b in boundaries]
+    letters = [b[1] for b in boundaries]
+    if np is not None:
+        idx = np.maximum(np.searchsorted(np.array(lows), cols.marks, side="right") - 1, 0)
+        counts = np.bincount(idx, minlength=len(letters))
+        return [letters[i] for i in idx.tolist()], {letters[i]: int(counts[i]) for i in range(len(letters)) if counts[i]}
+    out, counts = [], {}
+    for m in cols.marks:
+        letter = letters[max(bisect.bisect_right(lows, m) - 1, 0)]
+        out.append(letter)
+        counts[letter] = counts.get(letter, 0) + 1
+    return out, {l: counts[l] for l in letters if l in counts}
+
+
+# Rank of every student by marks, 1 = highest; equal marks share the best rank (1, 2, 2, 4).
+def rank(cols: Columns) -> List[int]:
+    n = len(cols)
+    if np is not None:
+        ordered = np.sort(cols.marks)
+        return (n - np.searchsorted(ordered, cols.marks, side="right") + 1).tolist()
+    ordered = sorted(cols.marks)
+    return [n - bisect.bisect_right(ordered, m) + 1 for m in cols.marks]
+
+
+def benchmark(repeat: int = 3) -> Dict[str, float]:
+    """Best time (seconds) of the storages functions and of the columnar versions, over `repeat` runs."""
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    courses = [c for c in storage.all_course_statistics()]
+    cols = load()
+    return {
+        "storages.course_statistics (every course)": best(lambda: [storage.course_statistics(c) for c in courses]),
+        "storages.sort_students": best(lambda: storage.sort_students(by="Marks", reverse=True)),
+        "analytics.load": best(load),
+        "analytics.course_stats": best(lambda: course_stats(cols)),
+        "analytics.rank": best(lambda: rank(cols)),
+        "analytics.bucket": best(lambda: bucket(cols)),
+    }
+
+
+if __name__ == "__main__":
+    print(f"NumPy: {'yes' if np is not None else 'no (pure Python fallback)'}, {len(load())} students")
+    for name, t in benchmark().items():
+        print(f"{name:45s} {t:.6f}s")
@@ -1,7 +1,10 @@
-import sys, time
+import json, sys, time
+_START = time.perf_counter()
 from models import Student, Course, Professor, Grade
 import storages as storage 
+import metrics
 from security import encrypt_password, decrypt_password 
+from query import any_of, contains
 
 
 
@@ -10,17 +13,49 @@ def prompt(msg):
 
 
 
+# Only the grades that are missing are added, in one write.
 def add_sample_grade_scale():
-    try:
-       storage.add_grade(Grade("A", "A", "90-100"))
-       storage.add_grade(Grade("B", "B", "80-89"))
-       storage.add_grade(Grade("C", "C", "70-79"))
-       storage.add_grade(Grade("D", "D", "60-69"))
-       storage.add_grade(Grade("F", "F", "<60"))
-    except Exception:
-        pass
+    return storage.seed_grades([
+        Grade("A", "A", "90-100"),
+        Grade("B", "B", "80-89"),
+        Grade("C", "C", "70-79"),
+        Grade("D", "D", "60-69"),
+        Grade("F", "F", "<60"),
+    ])
 
 
+'''python app.py startup measures how long the program takes to be ready: importing the modules (from the first
+line of app.py), seeding the grade scale and loading every table. STARTUP_TARGET is the goal for the total.'''
+STARTUP_TARGET = 0.25
+
+
+def startup_time() -> dict:
+    times = {"import": time.perf_counter() - _START}
+    start = time.perf_counter()
+    add_sample_grade_scale()
+    times["grade scale"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for table in storage.FILES:
+        storage.count(table)
+    times["load tables"] = time.perf_counter() - start
+    times["total"] = sum(times.values())
+    return times
+
+
+
+# One line per storage function that was called: calls, errors, average/p95/max time, rows, bytes, cache hits.
+def print_performance():
+    data = storage.performance()
+    print(f"{'operation':22s} {'calls':>7s} {'errors':>6s} {'avg ms':>9s} {'p95 ms':>8s} {'max ms':>9s} "
+          f"{'scanned':>9s} {'read B':>10s} {'written B':>10s} {'hits':>6s}")
+    for name, op in data["operations"].items():
+        hits = "-" if op["cache_hit_rate"] is None else f"{op['cache_hit_rate']:.0%}"
+        print(f"{name:22s} {op['count']:7d} {op['errors']:6d} {op['average_ms']:9.3f} {op['p95_ms']:>8} "
+              f"{op['max_ms']:9.3f} {op['rows_scanned']:9d} {op['bytes_read']:10d} {op['bytes_written']:10d} {hits:>6s}")
+    cache = data["cache"]
+    rate = "-" if cache["hit_rate"] is None else f"{cache['hit_rate']:.1%}"
+    print(f"Cache ({cache['backend']}): {cache.get('hits', 0)} hits, {cache.get('misses', 0)} misses, hit rate {rate}")
+
 
 def menu():
     add_sample_grade_scale()
@@ -28,7 +63,7 @@ def menu():
         print("\n=== CheckMyGrade ===")
         print("1) Add Student  2) Delete Student  3) Update Student  4) Search Students")
         print("5) Sort Students 6) Courses CRUD   7) Professors CRUD 8) Login/Users")
-        print("9) Reports/Stats 0) Exit")
+        print("9) Reports/Stats 10) Import/Export CSV 11) Performance 0) Exit")
         choice = prompt("Select: ")
         if choice == "1":
             email = prompt("Email: ")
@@ -58,10 +93,10 @@ def menu():
 
         elif choice == "4":
             term = prompt("Search term (matches first/last/email/course): ").lower()
-            results, t =storage.search_students(lambda r: term in r['First_name'].lower()
-                                                 or term in r['Last_name'].lower()
-                                                 or term in r['Email_address'].lower()
-                                                 or term in r['Course_id'].lower())
+            results, t =storage.search_students(any_of(contains("First_name", term),
+                                                        contains("Last_name", term),
+                                                        contains("Email_address", term),
+                                                        contains("Course_id", term)))
             print(f"Found {len(results)} students in {t:.6f}s")
             for r in results[:20]:
                 print(r)
@@ -69,8 +104,10 @@ def menu():
         elif choice == "5":
             by = prompt("Sort by (Marks or Email_address): ")
             reverse = prompt("Descending? (y/n): ").lower() == "y"
-            rows, t = storage.sort_students(by=by, reverse=reverse)
-            print(f"Sorted {len(rows)} students in {t:.6f}s (showing top 20)")
+            page = prompt("Page (1 = top 20): ")
+            offset = (int(page) - 1) * 20 if page.isdigit() and int(page) > 0 else 0
+            rows, t = storage.sort_students(by=by, reverse=reverse, limit=20, offset=offset)
+            print(f"Sorted {storage.count('students')} students in {t:.6f}s (showing rows {offset + 1}-{offset + len(rows)})")
             for r in rows[:20]:
                 print(r)
 
@@ -142,27 +179,69 @@ def menu():
                 storage.update_login(uid, password=token)
                 print("Password updated.")
         elif choice == "9":
-            sub = prompt("(c)ourse-wise (p)rofessor-wise (s)tudent-wise stats/report? ")
+            sub = prompt("(c)ourse-wise (a)ll courses (p)rofessor-wise (s)tudent-wise stats/report, (r)oster? ")
             if sub == "c":
                 cid = prompt("Course ID: ")
-                stats =storage.course_statistics(cid)
+                stats =storage.course_statistics(cid, percentiles=(25, 75, 90))
                 rows =storage.report_by_course(cid)
                 print("Stats:", stats)
                 print("Students (first 20):")
                 for r in rows[:20]:
                     print(r)
+            elif sub == "a":
+                for cid, stats in storage.all_course_statistics().items():
+                    print(f"{cid}: {stats['count']} students, average {stats['average']:.2f}, "
+                          f"median {stats['median']:.2f}, stddev {stats['stddev']:.2f}, grades {stats['grades']}")
             elif sub == "p":
                 pid = prompt("Professor id: ")
                 rows =storage.report_by_professor(pid)
                 print(f"{len(rows)} students (first 20):")
                 for r in rows[:20]:
                     print(r)
+            elif sub == "r":
+                key = prompt("Course ID or professor id: ")
+                rows = storage.course_roster(key) or storage.professor_roster(key)
+                print(f"{len(rows)} students (first 20):")
+                for r in rows[:20]:
+                    print(f"{r['Email_address']:30s} {r['First_name']} {r['Last_name']:15s} {r['Marks']:>6s}  "
+                          f"{r['Course_id']} {r['Course_name']} ({r['Credits']} credits)  {r['Professor_Name']}")
             elif sub == "s":
                 email = prompt("Student email: ")
                 rows =storage.report_by_student(email)
                 print(f"{len(rows)} record(s):")
                 for r in rows:
                     print(r)
+        elif choice == "10":
+            sub = prompt("(i)mport (e)xport? ")
+            table = prompt("Table (students,courses,professors,login,grades): ")
+            path = prompt("CSV file: ")
+            if table not in storage.FILES:
+                print("Unknown table.")
+            elif sub == "i":
+                n = storage.import_csv(table, path)
+                print(f"Imported {n} rows.")
+            elif sub == "e":
+                n = storage.export_csv(table, path)
+                print(f"Exported {n} rows.")
+        elif choice == "11":
+            print_performance()
+            sub = prompt("(d)ump JSON (r)eset (p)rofile slow calls on/off? ")
+            if sub == "d":
+                path = prompt("JSON file: ")
+                metrics.dump(path, {"cache": storage.performance()["cache"]})
+                print(f"Metrics written to {path}.")
+            elif sub == "r":
+                metrics.reset()
+                print("Metrics reset.")
+            elif sub == "p" and metrics.profiling():
+                for p in metrics.stop_profiling():
+                    print(f"--- {p['op']} {p['ms']:.1f} ms")
+                    print(p["top"])
+                print("Profiling off.")
+            elif sub == "p":
+                ms = prompt("Keep profiles of calls slower than (ms, default 100): ")
+                metrics.start_profiling(float(ms) if ms else 100.0)
+                print("Profiling on: choose this again to see the slow calls and turn it off.")
         elif choice == "0":
             print("Bye.")
             break
@@ -171,5 +250,69 @@ def menu():
 
 
 
+# Command line: "python app.py" starts the menu,
+# "python app.py import students new_students.csv" / "python app.py export students out.csv" run one bulk job,
+# "python app.py migrate" copies the CSV files into the SQLite database (see storages.use_backend).
+def main(argv):
+    if len(argv) == 4 and argv[1] in ("import", "export") and argv[2] in storage.FILES:
+        start = time.perf_counter()
+        if argv[1] == "import":
+            n = storage.import_csv(argv[2], argv[3])
+        else:
+            n = storage.export_csv(argv[2], argv[3])
+        print(f"{argv[1].capitalize()}ed {n} {argv[2]} rows in {time.perf_counter() - start:.3f}s")
+    elif len(argv) in (5, 6) and argv[1] == "sort" and argv[2] in storage.FILES:
+        start = time.perf_counter()
+        n = storage.export_sorted(argv[2], argv[4], argv[3], reverse=len(argv) == 6 and argv[5] == "desc")
+        print(f"Sorted {n} {argv[2]} rows by {argv[3]} in {time.perf_counter() - start:.3f}s")
+    elif len(argv) in (2, 3) and argv[1] == "batch":
+        import batch
+        start = time.perf_counter()
+        if len(argv) == 3 and argv[2] != "-":
+            with open(argv[2], encoding="utf-8") as f:
+                counts = batch.run(f)
+        else:
+            counts = batch.run(sys.stdin)
+        print(f"{counts['ops']} ops, {counts['errors']} errors in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+        return 1 if counts["errors"] else 0
+    elif len(argv) in (2, 3) and argv[1] == "serve":
+        import server
+        server.run(*argv[2:])
+    elif len(argv) in (2, 3) and argv[1] == "client":
+        # thin client: the server does the work, this process only passes lines along
+        import server
+        errors = 0
+        with server.Client(*argv[2:]) as client:
+            for text in sys.stdin:
+                text = text.strip()
+                if not text or text.startswith("#"):
+                    continue
+                try:
+                    out = client.request(json.loads(text))
+                except ValueError as e:
+                    out = {"op": None, "ok": False, "error": f"Bad JSON: {e}"}
+                errors += not out["ok"]
+                print(json.dumps(out, default=str), flush=True)
+        return 1 if errors else 0
+    elif len(argv) == 2 and argv[1] == "startup":
+        times = startup_time()
+        for name, t in times.items():
+            print(f"{name:12s} {t * 1000:8.1f} ms")
+        ok = times["total"] <= STARTUP_TARGET
+        print(f"target {STARTUP_TARGET * 1000:.0f} ms: {'ok' if ok else 'missed'}")
+        return 0 if ok else 1
+    elif len(argv) in (2, 3) and argv[1] == "migrate":
+        counts = storage.migrate_to_sqlite(argv[2] if len(argv) == 3 else None)
+        for table, n in counts.items():
+            print(f"{table}: {n} rows copied to SQLite")
+    elif len(argv) > 1:
+        print("Usage: python app.py [import|export <table> <file.csv> | sort <table> <column> <file.csv> [desc] "
+              "| batch [ops.jsonl] | serve [address] | client [address] | migrate [database.db] | startup]")
+        return 2
+    else:
+        menu()
+    return 0
+
+
 if __name__ == "__main__":
-    menu()
+    sys.exit(main(sys.argv))
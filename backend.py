@@ -0,0 +1,151 @@
+"""Interface shared by the storage backends (CSV files or SQLite).
+
+storages.py implements the public functions (add_student, report_by_course, ...) on top of the few
+operations below, so a backend only has to know how to find, list and change rows.
+Rows are dictionaries with the CSV column names as keys and text values, and keys are compared
+case-insensitively. Rows returned by a backend belong to it: callers copy them before changing them.
+"""
+
+import heapq
+import os
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import stats
+
+
+class ConflictError(ValueError):
+    """The table was changed by someone else between reading it and writing a change based on what was read."""
+
+
+# Sort key for a column: numbers for numeric columns (a value that is not a number sorts first), lower-case text otherwise.
+def sort_key(by: str, numeric: bool) -> Callable[[dict], object]:
+    if not numeric:
+        return lambda r: r.get(by, "").lower()
+
+    def number(r):
+        if by == "Marks":
+            m = stats.marks_of(r)  # StudentRow keeps the parsed marks
+            return float("-inf") if m is None else m
+        try:
+            return float(r[by])
+        except ValueError:
+            return float("-inf")
+    return number
+
+
+# Opens a CSV file to append rows to it. A file edited by hand (or by another program) may not end with a line
+# break; one is written first, or the first new row would be glued onto the last line of the file.
+def open_append(path: str):
+    missing = False
+    try:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            missing = f.read(1) not in (b"\n", b"\r")
+    except OSError:  # no file yet, or an empty one
+        pass
+    f = open(path, "a", newline="", encoding="utf-8")
+    if missing:
+        f.write("\r\n")
+    return f
+
+
+class Backend:
+    name = "base"
+
+    # Row with this primary key, or None.
+    def find(self, key: str, value: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    # {lower-case key: row} for the keys in values that exist (ex: to check a whole batch before inserting it).
+    def find_many(self, key: str, values: Iterable[str]) -> Dict[str, dict]:
+        found = {}
+        for v in values:
+            row = self.find(key, v)
+            if row is not None:
+                found[v.lower()] = row
+        return found
+
+    # All rows of a table, in insertion order.
+    def rows(self, key: str) -> List[dict]:
+        raise NotImplementedError
+
+    # The same rows one at a time. Backends that can read a table without holding all of it override this,
+    # so a caller that stops early (break) never reads the rest.
+    def iter_rows(self, key: str) -> Iterator[dict]:
+        return iter(self.rows(key))
+
+    # Rows where `col` equals value (case-insensitive). Backends with an index on the column override this.
+    def where(self, key: str, col: str, value: str) -> List[dict]:
+        value = value.lower()
+        return [r for r in self.iter_rows(key) if r[col].lower() == value]
+
+    # Rows where value (lower case) is part of `col`. Backends may return extra rows (the caller checks them
+    # again) but never miss one.
+    def contains(self, key: str, col: str, value: str) -> List[dict]:
+        return [r for r in self.iter_rows(key) if value in r[col].lower()]
+
+    def count(self, key: str) -> int:
+        return len(self.rows(key))
+
+    # Rows ordered by `by`, skipping `offset` rows and returning at most `limit`. When only the first page
+    # is wanted, heapq keeps the best offset + limit rows instead of sorting the whole table.
+    def sorted_rows(self, key: str, by: str, numeric: bool, reverse: bool = False,
+                    offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        rows = self.rows(key)
+        kf = sort_key(by, numeric)
+        if limit is None:
+            return sorted(rows, key=kf, reverse=reverse)[offset:]
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        return pick(offset + limit, rows, key=kf)[offset:]
+
+    # Statistics of one course (see stats.py). Backends that keep running totals override these two.
+    def course_statistics(self, course_id: str, percentiles: Sequence[float] = ()) -> Optional[dict]:
+        return stats.summarize(self.where("students", "Course_id", course_id), percentiles)
+
+    def all_course_statistics(self, percentiles: Sequence[float] = ()) -> Dict[str, dict]:
+        return stats.summarize_by_course(self.iter_rows("students"), percentiles)
+
+    # An opaque version of a table (None if the backend does not track versions). Reads made after this call
+    # see at least this version.
+    def version(self, key: str) -> object:
+        return None
+
+    # changes is a list of (op, row): "I" insert, "U" replace the row with the same key, "D" delete by key.
+    # With expected (from version()), ConflictError is raised instead if the table is no longer at that version.
+    def apply(self, key: str, changes: List[Tuple[str, dict]], expected: object = None):
+        raise NotImplementedError
+
+    # Context manager held by storages while it reads the rows a change is based on and applies the change, so
+    # another writer cannot change them in between (it waits). Backends without one rely on version() checks.
+    def write_lock(self, key: str):
+        return nullcontext()
+
+    # Context manager: changes made inside are saved together, or not at all if the block raises.
+    def transaction(self):
+        raise NotImplementedError
+
+    def compact(self, key: Optional[str] = None):
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        return {}
+
+    def clear_cache(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Copies every row of the given tables from one backend into another (the target tables are emptied first).
+def copy_tables(source: Backend, target: Backend, keys: Iterable[str], key_columns: Dict[str, str]) -> Dict[str, int]:
+    counts = {}
+    with target.transaction():
+        for key in keys:
+            rows = source.rows(key)
+            pk = key_columns[key]
+            target.apply(key, [("D", {pk: r[pk]}) for r in target.rows(key)])
+            target.apply(key, [("I", dict(r)) for r in rows])
+            counts[key] = len(rows)
+    return counts
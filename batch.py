@@ -0,0 +1,203 @@
+"""Batch mode: runs many operations in one process, read as JSON lines, with one JSON line out per operation.
+
+    python app.py batch ops.jsonl        # or: python app.py batch < ops.jsonl
+
+Every input line is an object with "op" (the name of a storages function below) and its arguments by name,
+plus an optional "id" that is copied to the output:
+
+    {"op": "add_student", "email_address": "a@x.com", "first_name": "A", "last_name": "B",
+     "course_id": "DATA200", "grade": "A", "marks": 95}
+    {"op": "update_student", "email": "a@x.com", "marks": 97}
+    {"op": "select", "table": "students", "where": {"eq": {"Course_id": "DATA200"}, "between": {"Marks": [90, 100]}},
+     "order_by": "Marks", "reverse": true, "limit": 10}
+    {"op": "course_statistics", "course_id": "DATA200", "percentiles": [25, 75]}
+
+Output lines look like {"line": 3, "op": "update_student", "ok": true, "result": null, "ms": 0.041}, or
+"ok": false with an "error" message. Blank lines and lines starting with # are skipped.
+
+Consecutive changes (add/update/delete) run together in one storage transaction, so a run of 1000 adds is
+written once instead of 1000 times; after each such group a {"op": "commit", "lines": [first, last], "ms": ...}
+line reports the time of the write. An operation that fails inside a group is reported and skipped, the others
+are saved. Reads see every change made before them.
+"""
+
+import json
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, TextIO
+
+import storages as storage
+from models import Course, Grade, Professor, Student
+from query import all_of, between, contains, eq, prefix
+from security import encrypt_password
+
+# Changes in a row that are grouped into one transaction at most.
+GROUP_MAX = 10_000
+
+
+def _call(fn: Callable) -> Callable[[dict], object]:
+    return lambda args: fn(**args)
+
+
+def _add(fn: Callable, model: type) -> Callable[[dict], object]:
+    return lambda args: fn(model(**args))
+
+
+def _add_login(args: dict):
+    storage.add_login(args["user_id"], encrypt_password(args["password"]), args["role"])
+
+
+def _update_login(args: dict):
+    args = dict(args)
+    if "password" in args:
+        args["password"] = encrypt_password(args["password"])
+    storage.update_login(**args)
+
+
+'''"where" for select: {"eq": {column: value}, "prefix": {...}, "contains": {...}, "between": {column: [low, high]}}.
+Every condition has to match (AND); a missing "where" returns every row.'''
+
+def _where(spec: Optional[dict]):
+    if not spec:
+        return None
+    makers = {"eq": eq, "prefix": prefix, "contains": contains}
+    parts = []
+    for kind, conditions in spec.items():
+        if kind == "between":
+            parts += [between(col, *bounds) for col, bounds in conditions.items()]
+        elif kind in makers:
+            parts += [makers[kind](col, value) for col, value in conditions.items()]
+        else:
+            raise ValueError(f"Unknown condition: {kind}")
+    return parts[0] if len(parts) == 1 else all_of(*parts)
+
+
+def _select(args: dict):
+    args = dict(args)
+    return storage.select(args.pop("table"), _where(args.pop("where", None)), **args)
+
+
+MUTATIONS: Dict[str, Callable[[dict], object]] = {
+    "add_student": _add(storage.add_student, Student),
+    "update_student": _call(storage.update_student),
+    "delete_student": _call(storage.delete_student),
+    "add_course": _add(storage.add_course, Course),
+    "update_course": _call(storage.update_course),
+    "delete_course": _call(storage.delete_course),
+    "add_professor": _add(storage.add_professor, Professor),
+    "update_professor": _call(storage.update_professor),
+    "delete_professor": _call(storage.delete_professor),
+    "add_grade": _add(storage.add_grade, Grade),
+    "update_grade": _call(storage.update_grade),
+    "delete_grade": _call(storage.delete_grade),
+    "add_login": _add_login,
+    "update_login": _update_login,
+}
+
+READS: Dict[str, Callable[[dict], object]] = {
+    "get_student": _call(storage.get_student),
+    "get_course": _call(storage.get_course),
+    "get_professor": _call(storage.get_professor),
+    "get_grade": _call(storage.get_grade),
+    "select": _select,
+    "sort_students": lambda args: storage.sort_students(**args)[0],
+    "count": _call(storage.count),
+    "report_by_course": _call(storage.report_by_course),
+    "report_by_professor": _call(storage.report_by_professor),
+    "report_by_student": _call(storage.report_by_student),
+    "course_roster": _call(storage.course_roster),
+    "professor_roster": _call(storage.professor_roster),
+    "join_tables": lambda args: storage.join_tables(**dict(args, where=_where(args.get("where")))),
+    "course_statistics": _call(storage.course_statistics),
+    "all_course_statistics": _call(storage.all_course_statistics),
+}
+
+
+# Runs one operation and returns its output line (as a dictionary).
+def execute(op: dict, line: int = 0) -> dict:
+    args = dict(op)
+    name = args.pop("op", None)
+    out = {"line": line, "op": name}
+    if "id" in args:
+        out["id"] = args.pop("id")
+    start = time.perf_counter()
+    try:
+        handler = MUTATIONS.get(name) or READS.get(name)
+        if handler is None:
+            raise ValueError(f"Unknown op: {name}")
+        result = handler(args)
+        out["ok"] = True
+        out["result"] = result
+    except Exception as e:
+        out["ok"] = False
+        out["error"] = f"{type(e).__name__}: {e}"
+    out["ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return out
+
+
+def is_mutation(op: dict) -> bool:
+    return op.get("op") in MUTATIONS
+
+
+# Runs a group of changes in one transaction. If saving fails, every operation of the group is reported as failed.
+def execute_group(group: List[tuple]) -> List[dict]:
+    if len(group) == 1:
+        return [execute(group[0][1], group[0][0])]
+    results = []
+    start = time.perf_counter()
+    try:
+        with storage.transaction():
+            for line, op in group:
+                results.append(execute(op, line))
+            save = time.perf_counter()
+    except Exception as e:
+        for r in results:
+            if r["ok"]:
+                r.update(ok=False, error=f"not saved: {type(e).__name__}: {e}")
+        commit = {"op": "commit", "lines": [group[0][0], group[-1][0]], "ok": False, "error": str(e)}
+    else:
+        commit = {"op": "commit", "lines": [group[0][0], group[-1][0]], "ok": True}
+        commit["ms"] = round((time.perf_counter() - save) * 1000, 3)
+    commit["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return results + [commit]
+
+
+def run(lines: Iterable[str], out: TextIO = sys.stdout, group_max: int = GROUP_MAX) -> Dict[str, int]:
+    """Runs every operation in lines, writing one JSON line per result to out. Returns {"ops": n, "errors": n}."""
+    counts = {"ops": 0, "errors": 0}
+    group: List[tuple] = []
+
+    def emit(results: List[dict]):
+        for r in results:
+            if r["op"] != "commit":
+                counts["ops"] += 1
+                counts["errors"] += not r["ok"]
+            out.write(json.dumps(r, default=str) + "\n")
+        out.flush()
+
+    def flush():
+        if group:
+            emit(execute_group(group))
+            group.clear()
+
+    for n, text in enumerate(lines, 1):
+        text = text.strip()
+        if not text or text.startswith("#"):
+            continue
+        try:
+            op = json.loads(text)
+            if not isinstance(op, dict):
+                raise ValueError("each line must be a JSON object")
+        except ValueError as e:
+            flush()
+            emit([{"line": n, "op": None, "ok": False, "error": f"Bad JSON: {e}", "ms": 0.0}])
+            continue
+        if is_mutation(op):
+            group.append((n, op))
+            if len(group) >= group_max:
+                flush()
+        else:
+            flush()
+            emit([execute(op, n)])
+    flush()
+    return counts
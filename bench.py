@@ -0,0 +1,231 @@
+"""Benchmark suite: throughput, latency percentiles, peak memory and bytes written of the storages operations
+on generated data sets.
+
+    python bench.py                                  # 1k, 10k and 100k students, printed as a table
+    python bench.py --sizes 1k,10k,1m --out results.json
+    python bench.py --baseline bench_baseline.json --update-baseline   # store these results as the baseline
+    python bench.py --baseline bench_baseline.json   # exit 1 if an operation got slower or bigger than allowed
+
+Every size runs in its own process on a fresh temporary data folder (CHECKMYGRADE_DATA), filled with
+generated students spread over many courses and professors, so the real data/ is never touched and one
+size cannot warm the cache of the next. Each operation is called several times; the first call runs under
+tracemalloc for its peak memory and is not timed, the others are timed one by one for ops/s and p50/p95/p99.
+Bytes written come from the process I/O counters (/proc/self/io, Linux only; null elsewhere).
+
+A result counts as a regression when its ops/s falls below baseline * (1 - tolerance) or its peak memory
+grows above baseline * (1 + tolerance). Baselines are machine-specific: update them on the machine that checks.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SIZES = "1k,10k,100k"
+STUDENTS_PER_COURSE = 200
+TOLERANCE = 0.25
+GRADES = [("A", 90), ("B", 80), ("C", 70), ("D", 60), ("F", 0)]
+
+
+def size_of(name: str) -> int:
+    return SIZES[name.lower()] if name.lower() in SIZES else int(name)
+
+
+# Writes the CSV tables straight into directory: n students over n / STUDENTS_PER_COURSE courses, one professor
+# per course. Seeded, so every run of a size has the same data.
+def generate(directory: str, n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    courses = max(1, n // STUDENTS_PER_COURSE)
+    os.makedirs(directory, exist_ok=True)
+
+    def write(name: str, header: List[str], rows):
+        with open(os.path.join(directory, name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def student(i: int):
+        marks = rnd.uniform(40, 100)
+        grade = next(g for g, low in GRADES if marks >= low)
+        return (f"s{i}@bench.edu", f"First{i % 997}", f"Last{i % 1009}", f"C{rnd.randrange(courses):05d}", grade,
+                f"{marks:.2f}")
+
+    write("students.csv", ["Email_address", "First_name", "Last_name", "Course_id", "Grade", "Marks"],
+          (student(i) for i in range(n)))
+    write("courses.csv", ["Course_id", "Course_name", "Description", "Credits"],
+          ((f"C{c:05d}", f"Course {c}", "Generated", str(1 + c % 4)) for c in range(courses)))
+    write("professors.csv", ["Professor_id", "Professor_Name", "Rank", "Course_id"],
+          ((f"p{c}@bench.edu", f"Professor {c}", "Professor", f"C{c:05d}") for c in range(courses)))
+    write("login.csv", ["User_id", "Password", "Role"], [])
+    write("grades.csv", ["Grade_id", "Grade", "Marks_range"], [(g, g, f"{low}-") for g, low in GRADES])
+
+
+def _written() -> Optional[int]:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(times: List[float], p: float) -> float:
+    return times[min(len(times) - 1, int(len(times) * p / 100))]
+
+
+def measure(fn: Callable, calls: List[tuple]) -> dict:
+    """Runs fn(*args) for every args in calls: the first under tracemalloc, the rest timed."""
+    tracemalloc.start()
+    fn(*calls[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    written = _written()
+    for args in calls[1:]:
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    after = _written()
+    total = sum(times)
+    times.sort()
+    return {"calls": len(times), "seconds": total, "ops_per_second": len(times) / total if total else 0.0,
+            "p50_ms": _percentile(times, 50) * 1000, "p95_ms": _percentile(times, 95) * 1000,
+            "p99_ms": _percentile(times, 99) * 1000, "peak_kb": peak / 1024,
+            "bytes_written": None if written is None or after is None else after - written}
+
+
+# One size, in this process. storages is imported here, after CHECKMYGRADE_DATA points at the generated data.
+def run_size(n: int, directory: str, repeat: int = 20) -> Dict[str, dict]:
+    generate(directory, n)
+    os.environ["CHECKMYGRADE_DATA"] = directory
+    os.environ["CHECKMYGRADE_SNAPSHOT"] = "0"
+    import storages as storage
+    from models import Student
+    from query import between, contains
+
+    rnd = random.Random(2)
+    courses = max(1, n // STUDENTS_PER_COURSE)
+    some = [f"s{rnd.randrange(n)}@bench.edu" for _ in range(repeat + 1)]
+    course = [f"C{rnd.randrange(courses):05d}" for _ in range(repeat + 1)]
+    new = [Student(f"new{i}@bench.edu", "New", "Student", course[i % len(course)], "B", 85) for i in range(repeat + 1)]
+    bulk = [[Student(f"bulk{b}_{i}@bench.edu", "Bulk", "Student", course[b], "C", 75) for i in range(1000)]
+            for b in range(4)]
+    full = max(3, min(repeat, 1_000_000 // max(n, 1)))  # whole-table operations: fewer calls on big tables
+
+    def cold_load():
+        storage.clear_cache()
+        storage.count("students")
+
+    results = {}
+    results["load"] = measure(cold_load, [()] * full)
+    results["add_student"] = measure(storage.add_student, [(s,) for s in new])
+    results["add_students_1000"] = measure(storage.add_students, [(b,) for b in bulk])
+    results["get_student"] = measure(storage.get_student, [(e,) for e in some])
+    results["update_student"] = measure(lambda e: storage.update_student(e, marks=rnd.uniform(40, 100)),
+                                        [(e,) for e in some])
+    results["search_contains"] = measure(lambda t: storage.select("students", contains("Last_name", t)),
+                                         [(f"last{i}",) for i in range(101, 101 + full)])
+    results["search_between_limit"] = measure(lambda lo: storage.select("students", between("Marks", lo, lo + 1), limit=10),
+                                              [(50 + i,) for i in range(repeat + 1)])
+    results["sort_top10"] = measure(lambda r: storage.sort_students("Marks", reverse=r, limit=10),
+                                    [(i % 2 == 0,) for i in range(repeat + 1)])
+    results["sort_all"] = measure(lambda by: storage.sort_students(by), [("Marks",), ("Last_name",)] * full)
+    results["course_statistics"] = measure(storage.course_statistics, [(c,) for c in course])
+    results["all_course_statistics"] = measure(storage.all_course_statistics, [((50, 90),)] * full)
+    results["report_by_course"] = measure(storage.report_by_course, [(c,) for c in course])
+    results["report_by_professor"] = measure(storage.report_by_professor,
+                                             [(f"p{int(c[1:])}@bench.edu",) for c in course])
+    results["delete_student"] = measure(storage.delete_student, [(s.email_address,) for s in new])
+    results["compact"] = measure(storage.compact, [()] * 2)
+    return results
+
+
+def run(sizes: List[str], repeat: int = 20) -> dict:
+    """Runs every size in a child process and returns the results of all of them."""
+    out = {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                    "backend": os.environ.get("CHECKMYGRADE_BACKEND", "csv"),
+                    "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+           "results": {}}
+    for name in sizes:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--one", str(size_of(name)),
+                                "--repeat", str(repeat)], capture_output=True, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"benchmark of {name} failed:\n{child.stderr}")
+        out["results"][name] = json.loads(child.stdout)
+    return out
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[str]:
+    """Regressions of results against baseline, as readable lines (empty if there are none). Sizes or
+    operations missing from either side are skipped."""
+    problems = []
+    for size, ops in results["results"].items():
+        for op, r in ops.items():
+            b = baseline.get("results", {}).get(size, {}).get(op)
+            if b is None:
+                continue
+            if r["ops_per_second"] < b["ops_per_second"] * (1 - tolerance):
+                problems.append(f"{size} {op}: {r['ops_per_second']:.1f} ops/s, baseline {b['ops_per_second']:.1f}")
+            if r["peak_kb"] > b["peak_kb"] * (1 + tolerance) and r["peak_kb"] - b["peak_kb"] > 64:
+                problems.append(f"{size} {op}: peak {r['peak_kb']:.0f} KB, baseline {b['peak_kb']:.0f} KB")
+    return problems
+
+
+def print_table(results: dict):
+    for size, ops in results["results"].items():
+        print(f"\n{size} students")
+        print(f"  {'operation':24s} {'ops/s':>10s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'peak KB':>10s} {'written':>12s}")
+        for op, r in ops.items():
+            written = "-" if r["bytes_written"] is None else str(r["bytes_written"])
+            print(f"  {op:24s} {r['ops_per_second']:10.1f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['p99_ms']:9.3f} "
+                  f"{r['peak_kb']:10.1f} {written:>12s}")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the storages operations on generated data.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated, from {', '.join(SIZES)} or numbers")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per operation")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file to compare with (or to write, with --update-baseline)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)  # child process: one size, JSON to stdout
+    args = parser.parse_args(argv)
+
+    if args.one is not None:
+        with tempfile.TemporaryDirectory(prefix="cmg-bench-") as tmp:
+            json.dump(run_size(args.one, tmp, args.repeat), sys.stdout)
+        return 0
+
+    results = run([s.strip() for s in args.sizes.split(",") if s.strip()], args.repeat)
+    print_table(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"\nbaseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        print(f"\n{len(problems)} regression(s) against {args.baseline}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,206 @@
+"""Optional binary file format for the students table, read and changed through mmap.
+
+data/students.bin holds the same rows as the students table as fixed-width records, so row i starts at
+HEADER.size + i * record size and any field of any row is at a known offset:
+
+    header  magic b"CMGB", format version, number of rows, byte width of each text field
+    record  Email_address, First_name, Last_name, Course_id, Grade (UTF-8, padded with zero bytes)
+            Marks (8-byte float, NaN when the CSV value was not a number)
+
+The widths are the longest value of each field when the file is written (Grade is at least 4 bytes), so
+nothing is cut off. Reading one field decodes only that field, marks() and iter_marks() read the float
+without touching the text, and set_marks()/set_grade() write into the record in place: the rest of the file
+is not rewritten. The table stays the main copy; to_binary()/to_csv() convert between the two:
+
+    python binstore.py to-bin [data/students.bin]      # students table -> binary
+    python binstore.py to-csv [data/students.bin]      # binary -> students table
+"""
+
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, Optional
+
+import storages as storage
+
+BIN_PATH = os.path.join(storage.DATA_DIR, "students.bin")
+MAGIC = b"CMGB"
+VERSION = 1
+TEXT_FIELDS = ("Email_address", "First_name", "Last_name", "Course_id", "Grade")
+HEADER = struct.Struct("<4sHI" + "H" * len(TEXT_FIELDS))
+MIN_GRADE_WIDTH = 4
+
+
+def _record(widths) -> struct.Struct:
+    return struct.Struct("<" + "".join(f"{w}s" for w in widths) + "d")
+
+
+def _marks(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+# Writes rows (dictionaries with the students.csv columns) as a new binary file and returns how many there were.
+def write(path: str, rows: List[dict]) -> int:
+    encoded = [[r.get(f, "").encode("utf-8") for f in TEXT_FIELDS] for r in rows]
+    widths = [max([len(e[i]) for e in encoded], default=0) for i in range(len(TEXT_FIELDS))]
+    widths[TEXT_FIELDS.index("Grade")] = max(widths[TEXT_FIELDS.index("Grade")], MIN_GRADE_WIDTH)
+    widths = [max(w, 1) for w in widths]
+    record = _record(widths)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(rows), *widths))
+        for r, e in zip(rows, encoded):
+            f.write(record.pack(*e, _marks(r.get("Marks", ""))))
+    os.replace(tmp, path)
+    return len(rows)
+
+
+class BinaryStudents:
+    """An open students.bin. Rows are numbered from 0 in file order."""
+
+    def __init__(self, path: str = BIN_PATH, writable: bool = False):
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except ValueError:  # an empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"{path} is not a students binary file.")
+        if len(self._mm) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a students binary file.")
+        magic, version, self.count, *widths = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a students binary file.")
+        self.widths = dict(zip(TEXT_FIELDS, widths))
+        self.record = _record(widths)
+        # byte offset of every field inside a record
+        self.offsets: Dict[str, int] = {}
+        pos = 0
+        for f in TEXT_FIELDS:
+            self.offsets[f] = pos
+            pos += self.widths[f]
+        self.offsets["Marks"] = pos
+        if HEADER.size + self.count * self.record.size > len(self._mm):
+            self.close()
+            raise ValueError(f"{path} is truncated.")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    # Byte offset of row i in the file.
+    def offset(self, i: int) -> int:
+        if not 0 <= i < self.count:
+            raise IndexError(f"Row {i} out of range (0-{self.count - 1}).")
+        return HEADER.size + i * self.record.size
+
+    # The raw bytes of one text field, without copying them out of the mapping (trailing zero bytes included).
+    # Release the memoryview before close().
+    def raw(self, i: int, field: str) -> memoryview:
+        start = self.offset(i) + self.offsets[field]
+        return memoryview(self._mm)[start:start + self.widths[field]]
+
+    def field(self, i: int, field: str) -> str:
+        if field == "Marks":
+            m = self.marks(i)
+            return "" if math.isnan(m) else f"{m:.2f}"
+        start = self.offset(i) + self.offsets[field]
+        return self._mm[start:start + self.widths[field]].rstrip(b"\0").decode("utf-8")
+
+    def marks(self, i: int) -> float:
+        return struct.unpack_from("<d", self._mm, self.offset(i) + self.offsets["Marks"])[0]
+
+    def row(self, i: int) -> dict:
+        values = self.record.unpack_from(self._mm, self.offset(i))
+        row = {f: v.rstrip(b"\0").decode("utf-8") for f, v in zip(TEXT_FIELDS, values)}
+        row["Marks"] = "" if math.isnan(values[-1]) else f"{values[-1]:.2f}"
+        return row
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self.count):
+            yield self.row(i)
+
+    # Marks of every row in file order, read straight from the records.
+    def iter_marks(self) -> Iterator[float]:
+        start = HEADER.size + self.offsets["Marks"]
+        for pos in range(start, start + self.count * self.record.size, self.record.size):
+            yield struct.unpack_from("<d", self._mm, pos)[0]
+
+    # Row number of an email (ASCII case-insensitive), or None. Only the email field of each record is compared.
+    def find(self, email: str) -> Optional[int]:
+        wanted = email.lower().encode("utf-8")
+        width = self.widths["Email_address"]
+        if len(wanted) > width:
+            return None
+        start = HEADER.size + self.offsets["Email_address"]
+        for i in range(self.count):
+            pos = start + i * self.record.size
+            if self._mm[pos:pos + width].rstrip(b"\0").lower() == wanted:
+                return i
+        return None
+
+    def set_marks(self, i: int, marks: float):
+        struct.pack_into("<d", self._mm, self.offset(i) + self.offsets["Marks"], float(marks))
+
+    def set_grade(self, i: int, grade: str):
+        data = grade.encode("utf-8")
+        width = self.widths["Grade"]
+        if len(data) > width:
+            raise ValueError(f"Grade must be at most {width} bytes in this file.")
+        start = self.offset(i) + self.offsets["Grade"]
+        self._mm[start:start + width] = data.ljust(width, b"\0")
+
+    def flush(self):
+        self._mm.flush()
+
+
+# The students table (as storages reads it: pending changes included, any backend), or another CSV with the
+# same columns -> binary file.
+def to_binary(bin_path: str = BIN_PATH, csv_path: Optional[str] = None) -> int:
+    if csv_path is None:
+        return write(bin_path, list(storage.iter_students()))
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return write(bin_path, rows)
+
+
+# Binary file -> the students table (made to hold exactly these rows with storages.replace_table, so the change
+# is checked against the table version and goes through the active backend), or another CSV file.
+def to_csv(bin_path: str = BIN_PATH, csv_path: Optional[str] = None) -> int:
+    with BinaryStudents(bin_path) as store:
+        rows = list(store)
+    if csv_path is None:
+        return storage.replace_table("students", rows)
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=storage.HEADERS["students"])
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (2, 3) and sys.argv[1] in ("to-bin", "to-csv"):
+        path = sys.argv[2] if len(sys.argv) == 3 else BIN_PATH
+        n = to_binary(path) if sys.argv[1] == "to-bin" else to_csv(path)
+        print(f"{n} students converted")
+    else:
+        print("Usage: python binstore.py to-bin|to-csv [file.bin]")
+        sys.exit(2)
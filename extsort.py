@@ -0,0 +1,62 @@
+"""External merge sort: sorts more rows than fit in memory.
+
+The rows are read run_size at a time; each run is sorted in memory and written to a temporary CSV file, so
+at most two runs are held at once (the one being written and the next one being read). The sorted runs are then merged with a heap (heapq.merge), which keeps one row per
+run in memory and yields the rows in order one at a time. The result is the same as sorted(): ties keep
+their original order, and reverse=True gives the descending order.
+
+    for row in extsort.sort_rows(storage.iter_students(), "Marks", numeric=True, reverse=True):
+        ...
+"""
+
+import csv
+import heapq
+import itertools
+import os
+import tempfile
+from typing import Iterable, Iterator, List, Optional
+
+from backend import sort_key
+
+RUN_SIZE = 100_000
+
+
+def _write_run(directory: str, n: int, rows: List[dict], fieldnames: List[str]) -> str:
+    path = os.path.join(directory, f"run{n}.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def _read_run(path: str) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def sort_rows(rows: Iterable[dict], by: str, numeric: bool = False, reverse: bool = False,
+              run_size: int = RUN_SIZE, directory: Optional[str] = None) -> Iterator[dict]:
+    """Rows ordered by column `by` (numbers when numeric, case-insensitive text otherwise), as a generator.
+    Runs are spilled to a temporary directory (inside `directory` if given) that is removed when the generator
+    is finished or closed. A table that fits in one run is sorted in memory without touching the disk."""
+    if run_size < 1:
+        raise ValueError("run_size must be at least 1.")
+    kf = sort_key(by, numeric)
+    rows = iter(rows)
+    first = list(itertools.islice(rows, run_size))
+    # sorted(reverse=True) keeps ties in their original order, and so does merging the runs in order
+    first.sort(key=kf, reverse=reverse)
+    more = list(itertools.islice(rows, run_size))
+    if not more:
+        yield from first
+        return
+    fieldnames = list(first[0].keys())
+    with tempfile.TemporaryDirectory(prefix="extsort-", dir=directory) as tmp:
+        runs = [_write_run(tmp, 0, first, fieldnames)]
+        del first
+        while more:
+            more.sort(key=kf, reverse=reverse)
+            runs.append(_write_run(tmp, len(runs), more, fieldnames))
+            more = list(itertools.islice(rows, run_size))
+        yield from heapq.merge(*[_read_run(p) for p in runs], key=kf, reverse=reverse)
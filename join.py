@@ -0,0 +1,85 @@
+"""Hash joins over table rows (dictionaries with the CSV column names).
+
+hash_join() reads the right side once into a hash table {lower-case key: [rows]} and then streams the left
+side through it, so joining n rows with m rows costs n + m dictionary operations instead of n * m comparisons.
+Put the smaller table on the right: it is the one held in memory, the left side can be a generator over a
+table of any size. Keys are compared case-insensitively, like everywhere else in storages.
+
+    for row in join.hash_join(storage.iter_students(), storage.select("courses"), "Course_id"):
+        print(row["Email_address"], row["Course_name"])
+
+roster() is the join behind the roster reports: every student with the name and credits of their course
+and the professors teaching it. storages.course_roster() returns the rows ordered by email.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# Columns a roster row has on top of the student columns.
+COURSE_COLUMNS = ("Course_name", "Credits")
+PROFESSOR_COLUMNS = ("Professor_id", "Professor_Name")
+ROSTER_COLUMNS = COURSE_COLUMNS + PROFESSOR_COLUMNS
+
+
+def index(rows: Iterable[dict], col: str) -> Dict[str, List[dict]]:
+    """The hash table of a join: {lower-case value of col: rows with that value}, in row order."""
+    table: Dict[str, List[dict]] = {}
+    for r in rows:
+        table.setdefault(r[col].lower(), []).append(r)
+    return table
+
+
+def hash_join(left: Iterable[dict], right: Iterable[dict], on: str, right_on: Optional[str] = None,
+              how: str = "inner", columns: Optional[Sequence[str]] = None) -> Iterator[dict]:
+    """Rows of left merged with every row of right where left[on] equals right[right_on] (default: on).
+    how="left" also keeps left rows without a match, with "" for the right columns. columns limits the
+    right columns that are copied (default: all of them); a column the left row already has keeps its
+    left value. The rows are new dictionaries, in the order of left."""
+    if how not in ("inner", "left"):
+        raise ValueError(f"Unknown join: {how} (use inner or left)")
+    right_on = right_on or on
+    right = list(right)
+    table = index(right, right_on)
+    if columns is None:
+        columns = [c for c in (right[0].keys() if right else ()) if c != right_on]
+    for l in left:
+        matches = table.get(l[on].lower())
+        if not matches:
+            if how == "left":
+                row = dict(l)
+                for c in columns:
+                    row.setdefault(c, "")
+                yield row
+            continue
+        for r in matches:
+            row = dict(l)
+            for c in columns:
+                row.setdefault(c, r[c])
+            yield row
+
+
+def professor_columns(professors: Sequence[dict]) -> dict:
+    """Professor columns of a roster row: the ids and names of all the course's professors, joined by "; ",
+    in Professor_id order (so they do not depend on the order the rows were stored in)."""
+    professors = sorted(professors, key=lambda p: p["Professor_id"].lower())
+    return {"Professor_id": "; ".join(p["Professor_id"] for p in professors),
+            "Professor_Name": "; ".join(p["Professor_Name"] for p in professors)}
+
+
+def course_columns(course: Optional[dict]) -> dict:
+    return {c: course[c] if course is not None else "" for c in COURSE_COLUMNS}
+
+
+def roster_row(student: dict, course: Optional[dict], professors: Sequence[dict]) -> dict:
+    row = dict(student)
+    row.update(course_columns(course))
+    row.update(professor_columns(professors))
+    return row
+
+
+def roster(students: Iterable[dict], courses: Iterable[dict], professors: Iterable[dict]) -> Iterator[dict]:
+    """students left-joined with courses on Course_id, plus the professors of each course (one row per
+    student, however many professors the course has)."""
+    by_course = index(professors, "Course_id")
+    for row in hash_join(students, courses, "Course_id", how="left", columns=COURSE_COLUMNS):
+        row.update(professor_columns(by_course.get(row["Course_id"].lower(), ())))
+        yield row
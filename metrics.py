@@ -0,0 +1,192 @@
+"""Operation metrics: how often each storages function is called, how long it takes and how much it reads.
+
+Every public function of storages is wrapped by instrument() when storages is imported. For each one we keep:
+    count, errors, total/average/max time, a latency histogram (HISTOGRAM_MS bucket limits, in milliseconds)
+    and estimated p50/p95/p99 (the upper limit of the bucket the percentile falls in),
+    rows returned (length of a list result, 1 for a row found by a get_* lookup), and the counters storages reports while the call runs:
+    rows_read (parsed from files), rows_scanned (rows handed to a full-table pass), bytes_read, bytes_written,
+    cache_hits and cache_misses.
+A call inside another call (search_students -> select) counts for both, like cumulative time in a profiler.
+
+    storage.performance()         # this snapshot, plus the cache counters of the backend
+    metrics.dump("metrics.json")  # the same as JSON; CHECKMYGRADE_METRICS_FILE=<path> dumps at exit
+    metrics.reset()
+
+Recording costs one to three microseconds per call; CHECKMYGRADE_METRICS=0 turns it off.
+
+Profiling is opt in: start_profiling(slower_than_ms) runs every outermost call under cProfile and keeps the
+profile of the ones slower than that (the op, its time and the top functions by cumulative time, and a .prof
+file if a directory is given). CHECKMYGRADE_PROFILE_MS=<ms> starts it at import. cProfile slows every call
+down, so leave it off unless you are looking for a hot path.
+"""
+
+import atexit
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional
+
+ENABLED = os.environ.get("CHECKMYGRADE_METRICS", "1") != "0"
+HISTOGRAM_MS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000)
+COUNTERS = ("rows_read", "rows_scanned", "bytes_read", "bytes_written", "cache_hits", "cache_misses")
+
+_ops: Dict[str, dict] = {}
+_totals = dict.fromkeys(COUNTERS, 0)
+_depth = 0                    # calls running now (a call inside another call is deeper)
+_profiling: Optional[dict] = None
+
+
+def _new(name: str) -> dict:
+    rec = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "rows_returned": 0,
+           "histogram": [0] * (len(HISTOGRAM_MS) + 1)}
+    rec.update(dict.fromkeys(COUNTERS, 0))
+    _ops[name] = rec
+    return rec
+
+
+def add(counter: str, n: int):
+    """Called by storages. A call gets the difference of the totals between its start and its end."""
+    _totals[counter] += n
+
+
+def instrument(name: str, fn: Callable) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        global _depth
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        before = tuple(_totals.values())
+        profile = _profile_start() if _profiling is not None and _depth == 0 else None
+        _depth += 1
+        result = None
+        ok = False
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            _depth -= 1
+            if profile is not None:
+                _profile_end(name, profile, ms)
+            rec = _ops.get(name) or _new(name)
+            rec["count"] += 1
+            rec["errors"] += not ok
+            rec["total_ms"] += ms
+            if ms > rec["max_ms"]:
+                rec["max_ms"] = ms
+            rec["histogram"][bisect_left(HISTOGRAM_MS, ms)] += 1
+            after = tuple(_totals.values())
+            if after != before:
+                for c, a, b in zip(COUNTERS, after, before):
+                    rec[c] += a - b
+            # search_students and sort_students return (rows, seconds)
+            rows = result[0] if isinstance(result, tuple) and result and isinstance(result[0], list) else result
+            if isinstance(rows, list):
+                rec["rows_returned"] += len(rows)
+            elif isinstance(rows, dict) and name.startswith("get_"):  # one row; other dicts are reports, not rows
+                rec["rows_returned"] += 1
+    return wrapper
+
+
+def _percentile(histogram: List[int], p: float) -> Optional[float]:
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for limit, n in zip(HISTOGRAM_MS + (float("inf"),), histogram):
+        seen += n
+        if seen >= total * p / 100:
+            return limit
+    return None
+
+
+def snapshot() -> dict:
+    """{"operations": {name: numbers}, "totals": counters over all calls, "profiles": slow calls captured}."""
+    ops = {}
+    for name, rec in sorted(_ops.items()):
+        out = dict(rec)
+        out["average_ms"] = rec["total_ms"] / rec["count"] if rec["count"] else 0.0
+        for p in (50, 95, 99):
+            out[f"p{p}_ms"] = _percentile(rec["histogram"], p)
+        lookups = rec["cache_hits"] + rec["cache_misses"]
+        out["cache_hit_rate"] = rec["cache_hits"] / lookups if lookups else None
+        ops[name] = out
+    return {"histogram_ms": list(HISTOGRAM_MS), "operations": ops, "totals": dict(_totals),
+            "profiles": list(_profiling["captured"]) if _profiling is not None else []}
+
+
+def dump(path: str, extra: Optional[dict] = None):
+    data = snapshot()
+    if extra:
+        data.update(extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, default=str)
+
+
+def reset():
+    _ops.clear()
+    for c in COUNTERS:
+        _totals[c] = 0
+    if _profiling is not None:
+        _profiling["captured"].clear()
+
+
+# Profiling
+
+def start_profiling(slower_than_ms: float = 100.0, keep: int = 20, directory: Optional[str] = None, top: int = 15):
+    global _profiling
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _profiling = {"slower_than_ms": slower_than_ms, "keep": keep, "directory": directory, "top": top,
+                  "captured": [], "n": 0}
+
+
+def stop_profiling() -> List[dict]:
+    """Stops profiling and returns the slow calls captured."""
+    global _profiling
+    captured = _profiling["captured"] if _profiling is not None else []
+    _profiling = None
+    return captured
+
+
+def profiling() -> bool:
+    return _profiling is not None
+
+
+def _profile_start() -> Optional[cProfile.Profile]:
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # another profiler is already running (ex: python -m cProfile app.py)
+        return None
+    return profile
+
+
+def _profile_end(name: str, profile: cProfile.Profile, ms: float):
+    profile.disable()
+    settings = _profiling
+    if settings is None or ms < settings["slower_than_ms"]:
+        return
+    text = io.StringIO()
+    pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(settings["top"])
+    entry = {"op": name, "ms": round(ms, 3), "top": text.getvalue()}
+    settings["n"] += 1
+    if settings["directory"]:
+        entry["file"] = os.path.join(settings["directory"], f"{name}-{settings['n']}.prof")
+        profile.dump_stats(entry["file"])
+    settings["captured"].append(entry)
+    del settings["captured"][:-settings["keep"]]
+
+
+if os.environ.get("CHECKMYGRADE_PROFILE_MS"):
+    start_profiling(float(os.environ["CHECKMYGRADE_PROFILE_MS"]))
+
+if os.environ.get("CHECKMYGRADE_METRICS_FILE"):
+    atexit.register(lambda: dump(os.environ["CHECKMYGRADE_METRICS_FILE"]))
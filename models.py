@@ -1,10 +1,14 @@
+import sys
 from dataclasses import dataclass,field
 from typing import List, Dict, Optional, Tuple
 
 # A dataclass is a special feature in Python helps you create classes meant to store data — without writing a lot of repetitive code.
 
+# __slots__ stores the fields in a fixed array instead of a per-object dictionary, which saves memory
+# when many Student objects exist (this only works because none of the fields has a default value).
 @dataclass
 class Student:
+    __slots__ = ("email_address", "first_name", "last_name", "course_id", "grade", "marks")
     email_address: str
     first_name: str
     last_name: str
@@ -34,3 +38,61 @@ class Professor:
     name: str
     rank: str
     course_id: str
+
+
+'''StudentRow is how storages keeps one row of students.csv in memory. It behaves like the row dictionary
+(row["Course_id"], row.get(...), dict(row)), but it uses __slots__, shares one copy of each Course_id and Grade
+string between all rows (sys.intern) and parses Marks into a float once. The Marks text is only kept when it is
+not simply the float with 2 decimals (ex: "77" after update_student(marks=77)), otherwise it is rebuilt on access.'''
+
+class StudentRow:
+    FIELDS = ("Email_address", "First_name", "Last_name", "Course_id", "Grade", "Marks")
+    _KEYS = dict.fromkeys(FIELDS).keys()
+    __slots__ = ("Email_address", "First_name", "Last_name", "Course_id", "Grade", "marks", "_marks_text")
+
+    def __init__(self, row):
+        self._set(row.get("Email_address", ""), row.get("First_name", ""), row.get("Last_name", ""),
+                  row.get("Course_id", ""), row.get("Grade", ""), row.get("Marks", ""))
+
+    # From the values in FIELDS order, without building a dictionary first.
+    @classmethod
+    def from_values(cls, values) -> "StudentRow":
+        row = cls.__new__(cls)
+        row._set(*values)
+        return row
+
+    # A short line in the CSV gives None for the missing columns; they are kept as "" like empty ones.
+    def _set(self, email, first, last, course, grade, text):
+        text = text or ""
+        self.Email_address = email or ""
+        self.First_name = first or ""
+        self.Last_name = last or ""
+        self.Course_id = sys.intern(course or "")
+        self.Grade = sys.intern(grade or "")
+        try:
+            self.marks = float(text)
+        except ValueError:
+            self.marks = None
+        self._marks_text = None if self.marks is not None and f"{self.marks:.2f}" == text else text
+
+    def __getitem__(self, k: str) -> str:
+        if k == "Marks":
+            return self._marks_text if self._marks_text is not None else f"{self.marks:.2f}"
+        if k in self._KEYS:
+            return getattr(self, k)
+        raise KeyError(k)
+
+    def get(self, k: str, default=None):
+        return self[k] if k in self._KEYS else default
+
+    def keys(self):
+        return self._KEYS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __repr__(self) -> str:
+        return f"StudentRow({dict(self)!r})"
@@ -0,0 +1,369 @@
+"""Students partitioned by course: one CSV file per Course_id under data/students/ (optional backend).
+
+data/students/manifest.json lists the shards:
+    {"version": 1, "shards": {lower-case Course_id: {"course_id": "DATA200", "file": "DATA200.csv", "rows": 120}}}
+A course report, the statistics of one course or a change to one student only read or write that course's file
+(moving a student to another course touches the two files involved), and counting students only reads the
+manifest. The other tables are not partitioned: they stay with the CSV backend.
+
+Every shard is cached in memory and read again only when its file changes on disk. map_shards() runs a function
+over every shard file in a process pool; all_course_statistics() uses it for big tables.
+Rows of the whole table come course by course, in the order of the manifest.
+"""
+
+import csv
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import stats
+from backend import Backend, open_append
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; see _manifest_lock
+    fcntl = None
+
+MANIFEST = "manifest.json"
+# Below this many students the per-course work is done in this process: starting worker processes costs more.
+PARALLEL_AFTER = 50_000
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _read(path: str) -> List[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+# Work done in the worker processes: they get the path of a shard file, not the rows.
+def _shard_statistics(path: str, percentiles: Sequence[float]) -> Optional[dict]:
+    return stats.summarize(_read(path), percentiles)
+
+
+class PartitionedBackend(Backend):
+    name = "partitioned"
+
+    def __init__(self, directory: str, headers: Dict[str, List[str]], keys: Dict[str, str], others: Backend,
+                 parallel_after: int = PARALLEL_AFTER):
+        self.directory = directory
+        self.header = headers["students"]
+        self.pk = keys["students"]
+        self.others = others
+        self.parallel_after = parallel_after
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self.lock_path = os.path.join(directory, "manifest.lock")
+        self._manifest: Optional[dict] = None
+        self._manifest_sig = None
+        self._shards: Dict[str, dict] = {}     # course -> {"sig": file signature, "rows": {lower-case email: row}}
+        self._owner: Dict[str, str] = {}       # lower-case email -> course, for the shards in _shards
+        self._dirty: Optional[set] = None      # shards changed inside a transaction
+        self._rewrite: set = set()             # ... of which these are rewritten at commit, the others appended to
+        self._appends: Dict[str, List[dict]] = {}
+        self._locked = 0                       # depth of _manifest_lock in this process
+        os.makedirs(directory, exist_ok=True)
+        with self._manifest_lock():
+            self.fresh = not os.path.exists(self.manifest_path)
+            if self.fresh:
+                self._manifest = {"version": 1, "shards": {}}
+                self._write_manifest()
+
+    # Manifest
+
+    # Changing students holds an exclusive lock on manifest.lock, from reading the shards a change is based on to
+    # writing them and the manifest, so two processes never work from the same old copy of a shard. Re-entrant
+    # within this process; like storages._lock it does nothing where fcntl does not exist.
+    @contextmanager
+    def _manifest_lock(self):
+        if fcntl is None or self._locked:
+            self._locked += 1
+            try:
+                yield
+            finally:
+                self._locked -= 1
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._locked = 1
+            try:
+                yield
+            finally:
+                self._locked = 0  # closing the file releases the lock
+
+    def _write_manifest(self):
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+        self._manifest_sig = _signature(self.manifest_path)
+
+    def _info(self) -> Dict[str, dict]:
+        if self._dirty is None and _signature(self.manifest_path) != self._manifest_sig:
+            self._manifest_sig = _signature(self.manifest_path)
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            for course in [c for c in self._shards if c not in self._manifest["shards"]]:
+                self._drop(course)
+        return self._manifest["shards"]
+
+    def _path(self, course: str) -> str:
+        return os.path.join(self.directory, self._info()[course]["file"])
+
+    def _file_name(self, course_id: str) -> str:
+        base = re.sub(r"[^A-Za-z0-9_-]+", "_", course_id) or "_"
+        used = {info["file"].lower() for info in self._info().values()}
+        name, n = base, 1
+        while f"{name}.csv".lower() in used:
+            n += 1
+            name = f"{base}_{n}"
+        return f"{name}.csv"
+
+    # Shards
+
+    def _drop(self, course: str):
+        entry = self._shards.pop(course, None)
+        if entry is not None:
+            for k in entry["rows"]:
+                if self._owner.get(k) == course:
+                    del self._owner[k]
+
+    # {lower-case email: row} of one course, read again if the file changed since it was cached.
+    def _shard(self, course: str) -> Dict[str, dict]:
+        entry = self._shards.get(course)
+        if self._dirty is not None and course in self._dirty:
+            return entry["rows"]
+        sig = _signature(self._path(course))
+        if entry is not None and entry["sig"] == sig:
+            return entry["rows"]
+        self._drop(course)
+        rows = {r[self.pk].lower(): r for r in _read(self._path(course))} if sig is not None else {}
+        self._shards[course] = {"sig": sig, "rows": rows}
+        for k in rows:
+            self._owner[k] = course
+        return rows
+
+    # Loads every shard (once) so any email can be found; returns {lower-case email: course}.
+    def _owners(self) -> Dict[str, str]:
+        for course in list(self._info()):
+            self._shard(course)
+        return self._owner
+
+    def _new_shard(self, course_id: str) -> str:
+        course = course_id.lower()
+        if course not in self._info():
+            self._manifest["shards"][course] = {"course_id": course_id, "file": self._file_name(course_id), "rows": 0}
+            self._shards[course] = {"sig": None, "rows": {}}
+        return course
+
+    # Writes the changed shards: appended rows are added to the end of the file, other changes rewrite it
+    # (temporary file + rename, like the CSV tables). Empty shards are removed. Under the manifest lock the manifest
+    # is read again from disk and only the entries of these shards are changed in it, so shards another process
+    # added or removed in the meantime are kept. If a shard file is not the one we read (only possible without
+    # fcntl, where the lock does nothing), our cached copy of it is dropped and read again next time.
+    def _flush(self, rewrite: set, appends: Dict[str, List[dict]]):
+        mine = self._manifest["shards"]
+        with self._manifest_lock():
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            info = manifest["shards"]
+            for course in rewrite | set(appends):
+                rows = self._shards[course]["rows"]
+                entry = info.get(course) or mine[course]
+                path = os.path.join(self.directory, entry["file"])
+                if not rows:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    info.pop(course, None)
+                    self._shards.pop(course)
+                    continue
+                if course in rewrite or not os.path.exists(path):
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp, "w", newline="", encoding="utf-8") as f:
+                        writer = csv.DictWriter(f, fieldnames=self.header)
+                        writer.writeheader()
+                        writer.writerows(rows.values())
+                    os.replace(tmp, path)
+                    entry["rows"] = len(rows)
+                    self._shards[course]["sig"] = _signature(path)
+                else:
+                    current = _signature(path) == self._shards[course]["sig"]
+                    with open_append(path) as f:
+                        csv.DictWriter(f, fieldnames=self.header).writerows(appends[course])
+                    entry["rows"] += len(appends[course])
+                    if current:
+                        self._shards[course]["sig"] = _signature(path)
+                    else:
+                        self._drop(course)
+                info[course] = entry
+            self._manifest = manifest
+            self._write_manifest()
+
+    # Backend interface: students go to the shards, everything else to the CSV backend.
+
+    def find(self, key, value):
+        if key != "students":
+            return self.others.find(key, value)
+        course = self._owners().get(value.lower())
+        return self._shard(course).get(value.lower()) if course is not None else None
+
+    def rows(self, key):
+        if key != "students":
+            return self.others.rows(key)
+        return [r for course in list(self._info()) for r in self._shard(course).values()]
+
+    def iter_rows(self, key) -> Iterator[dict]:
+        if key != "students":
+            return self.others.iter_rows(key)
+        return (r for course in list(self._info()) for r in list(self._shard(course).values()))
+
+    def where(self, key, col, value):
+        if key != "students":
+            return self.others.where(key, col, value)
+        if col != "Course_id":
+            return super().where(key, col, value)
+        course = value.lower()
+        return list(self._shard(course).values()) if course in self._info() else []
+
+    def contains(self, key, col, value):
+        if key != "students":
+            return self.others.contains(key, col, value)
+        return super().contains(key, col, value)
+
+    def count(self, key):
+        if key != "students":
+            return self.others.count(key)
+        if self._dirty:
+            return sum(len(self._shard(c)) for c in self._info())
+        return sum(info["rows"] for info in self._info().values())
+
+    def sorted_rows(self, key, by, numeric, reverse=False, offset=0, limit=None):
+        if key != "students":
+            return self.others.sorted_rows(key, by, numeric, reverse, offset, limit)
+        return super().sorted_rows(key, by, numeric, reverse, offset, limit)
+
+    def course_statistics(self, course_id, percentiles=()):
+        return stats.summarize(self.where("students", "Course_id", course_id), percentiles)
+
+    def all_course_statistics(self, percentiles=()):
+        info = self._info()
+        if self._dirty or self.count("students") < self.parallel_after:
+            results = {c: stats.summarize(self._shard(c).values(), percentiles) for c in list(info)}
+        else:
+            results = self.map_shards(_shard_statistics, tuple(percentiles))
+        return {info[c]["course_id"]: st for c, st in results.items() if st is not None}
+
+    def version(self, key):
+        return self.others.version(key) if key != "students" else None
+
+    def write_lock(self, key):
+        return self.others.write_lock(key) if key != "students" else self._manifest_lock()
+
+    def apply(self, key, changes, expected=None):
+        if key != "students":
+            return self.others.apply(key, changes, expected)
+        if not changes:
+            return
+        if self._dirty is not None:
+            self._apply(changes)
+            return
+        # the shards are read again (if their files changed) and written under the same lock
+        with self._manifest_lock():
+            self._flush(*self._apply(changes))
+
+    def _apply(self, changes) -> Tuple[set, Dict[str, List[dict]]]:
+        owners = self._owners()
+        rewrite, appends = set(), {}
+        for op, row in changes:
+            k = row[self.pk].lower()
+            old = owners.get(k)
+            if op == "D" or (op == "U" and old is None):
+                if op == "D" and old is not None:
+                    del self._shards[old]["rows"][k]
+                    del owners[k]
+                    rewrite.add(old)
+                continue
+            course = self._new_shard(row.get("Course_id", ""))
+            if old is not None and old != course:
+                del self._shards[old]["rows"][k]
+                rewrite.add(old)
+            if old is None and op == "I":
+                appends.setdefault(course, []).append(row)
+            else:
+                rewrite.add(course)
+            self._shards[course]["rows"][k] = dict(row)
+            owners[k] = course
+        if self._dirty is not None:
+            self._dirty |= rewrite | set(appends)
+            self._rewrite |= rewrite
+            for course, rows in appends.items():
+                self._appends.setdefault(course, []).extend(rows)
+        return rewrite, appends
+
+    # Shard changes stay in memory until the block ends. The CSV backend's transaction for the other tables commits
+    # first, and only when it succeeded are the changed shards and the manifest written (rows only added to a shard
+    # are appended to it, like outside a transaction), so a conflict on the other tables saves nothing. If the block
+    # or that commit raises, the cached shards are dropped. The manifest lock is held for the whole block (like
+    # BEGIN IMMEDIATE in SQLite), so the shards read inside it are still the ones on disk when they are written.
+    @contextmanager
+    def transaction(self):
+        if self._dirty is not None:
+            yield
+            return
+        with self._manifest_lock():
+            self._info()  # the manifest is not read again until the block ends, so start from the one on disk
+            self._dirty = set()
+            try:
+                with self.others.transaction():
+                    yield
+                self._dirty = None
+                self._flush(self._rewrite, self._appends)
+            except BaseException:
+                self._dirty = None
+                self.clear_cache()
+                raise
+            finally:
+                self._dirty = None
+                self._rewrite, self._appends = set(), {}
+
+    # Runs fn(shard file path, *args) for every course in a process pool: {lower-case Course_id: result}.
+    # fn must be a module-level function (it is sent to the worker processes) and sees the files on disk.
+    def map_shards(self, fn: Callable, *args, workers: Optional[int] = None) -> Dict[str, object]:
+        courses = list(self._info())
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {c: pool.submit(fn, self._path(c), *args) for c in courses}
+            return {c: f.result() for c, f in futures.items()}
+
+    # Copies every shard into directory as one CSV per course; returns {Course_id: rows}. A shard already is a
+    # finished CSV file, so this is a plain file copy per course.
+    def export_courses(self, directory: str) -> Dict[str, int]:
+        os.makedirs(directory, exist_ok=True)
+        info = self._info()
+        for c in info:
+            shutil.copyfile(self._path(c), os.path.join(directory, info[c]["file"]))
+        return {i["course_id"]: i["rows"] for i in info.values()}
+
+    def compact(self, key=None):
+        if key != "students":
+            self.others.compact(key)
+
+    def stats(self):
+        return dict(self.others.stats(), backend=self.name, directory=self.directory, shards=len(self._info()))
+
+    def clear_cache(self):
+        self.others.clear_cache()
+        self._shards.clear()
+        self._owner.clear()
+        self._manifest_sig = None
+
+    def close(self):
+        self.others.close()
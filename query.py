@@ -0,0 +1,145 @@
+"""Declarative queries for storages.search_students / storages.select.
+
+Instead of an opaque lambda, a query describes what to match, so the planner can see when an index
+can answer it:
+
+    from query import eq, prefix, contains, between, any_of
+    q = eq("Course_id", "DATA200") & between("Marks", 90, 100)
+    rows, t = storage.search_students(q, order_by="Marks", reverse=True, limit=10)
+
+Text comparisons are case-insensitive, like the rest of storages. between() compares numbers.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from backend import Backend
+
+
+@dataclass(frozen=True)
+class Query:
+    op: str                 # "eq", "prefix", "contains", "range", "and", "or"
+    field: str = ""
+    value: object = None
+    high: object = None     # upper bound for "range"
+    parts: Tuple["Query", ...] = ()
+
+    def __and__(self, other: "Query") -> "Query":
+        return all_of(self, other)
+
+    def __or__(self, other: "Query") -> "Query":
+        return any_of(self, other)
+
+
+def eq(field: str, value: str) -> Query:
+    return Query("eq", field, str(value).lower())
+
+
+def prefix(field: str, value: str) -> Query:
+    return Query("prefix", field, str(value).lower())
+
+
+def contains(field: str, value: str) -> Query:
+    return Query("contains", field, str(value).lower())
+
+
+# low <= float(field) <= high; either bound may be None (open).
+def between(field: str, low: Optional[float] = None, high: Optional[float] = None) -> Query:
+    return Query("range", field, low, high)
+
+
+def all_of(*parts: Query) -> Query:
+    return Query("and", parts=tuple(parts))
+
+
+def any_of(*parts: Query) -> Query:
+    return Query("or", parts=tuple(parts))
+
+
+def matches(q: Query, row: dict) -> bool:
+    if q.op == "and":
+        return all(matches(p, row) for p in q.parts)
+    if q.op == "or":
+        return any(matches(p, row) for p in q.parts)
+    if q.op == "range":
+        try:
+            x = float(row[q.field])
+        except ValueError:
+            return False
+        return (q.value is None or x >= q.value) and (q.high is None or x <= q.high)
+    text = row[q.field].lower()
+    if q.op == "eq":
+        return text == q.value
+    if q.op == "prefix":
+        return text.startswith(q.value)
+    if q.op == "contains":
+        return q.value in text
+    raise ValueError(f"Unknown query operation: {q.op}")
+
+
+'''Planning: a plan says where the candidate rows come from, and every candidate is then checked with matches().
+    ("pk", value)           the row with that primary key
+    ("index", col, value)   rows from the secondary index of col
+    ("text", col, value)    rows from the trigram index of col that may contain value
+    ("union", [plans])      an OR whose branches all have an index
+    ("scan",)               every row of the table
+For an AND one indexed part is enough (the primary key is preferred), for an OR every part needs one.'''
+
+def plan(q: Query, pk: str, indexed: Sequence[str], text_indexed: Sequence[str] = ()) -> tuple:
+    if q.op == "eq" and q.field == pk:
+        return ("pk", q.value)
+    if q.op == "eq" and q.field in indexed:
+        return ("index", q.field, q.value)
+    if q.op == "contains" and q.field in text_indexed and len(q.value) >= 3:
+        return ("text", q.field, q.value)
+    if q.op == "and":
+        plans = [plan(p, pk, indexed, text_indexed) for p in q.parts]
+        for kind in ("pk", "index", "text", "union"):
+            for p in plans:
+                if p[0] == kind:
+                    return p
+    if q.op == "or" and q.parts:
+        plans = [plan(p, pk, indexed, text_indexed) for p in q.parts]
+        if all(p[0] != "scan" for p in plans):
+            return ("union", plans)
+    return ("scan",)
+
+
+def explain(p: tuple) -> str:
+    if p[0] == "pk":
+        return "primary key"
+    if p[0] == "index":
+        return f"index {p[1]}"
+    if p[0] == "text":
+        return f"text index {p[1]}"
+    if p[0] == "union":
+        return "union(" + ", ".join(explain(x) for x in p[1]) + ")"
+    return "scan"
+
+
+def candidates(backend: Backend, key: str, pk: str, p: tuple) -> Iterable[dict]:
+    if p[0] == "pk":
+        row = backend.find(key, p[1])
+        return [row] if row is not None else []
+    if p[0] == "index":
+        return backend.where(key, p[1], p[2])
+    if p[0] == "text":
+        return backend.contains(key, p[1], p[2])
+    if p[0] == "union":
+        seen = {}
+        for sub in p[1]:
+            for row in candidates(backend, key, pk, sub):
+                seen.setdefault(row[pk].lower(), row)
+        return seen.values()
+    return backend.iter_rows(key)
+
+
+def run(backend: Backend, key: str, pk: str, indexed: Sequence[str], text_indexed: Sequence[str], q: Query,
+        limit: Optional[int] = None) -> List[dict]:
+    results = []
+    for row in candidates(backend, key, pk, plan(q, pk, indexed, text_indexed)):
+        if matches(q, row):
+            results.append(row)
+            if limit is not None and len(results) >= limit:
+                break
+    return results
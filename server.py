@@ -0,0 +1,273 @@
+"""Local server: one process keeps the tables warm and answers many clients over a socket.
+
+    python app.py serve [address]       # address is host:port (default 127.0.0.1:8765) or unix:/path/to.sock
+    python app.py client [address]     # JSON lines from stdin to the server, its answers to stdout
+
+The protocol is the one of batch mode (see batch.py), over a connection: the client sends one JSON object per
+line, {"op": "get_student", "email": "a@x.com"}, and gets one JSON line back per request, in order, with
+"ok", "result" or "error", and "ms". {"op": "server_stats"} returns the server's own counters.
+
+Tables are loaded once when the server starts and stay cached (with their indexes) for every client. Reads are
+answered right away. Changes from all connections go into one queue that a single writer task empties: whatever
+is waiting when it wakes up (at most batch.GROUP_MAX changes) is saved in one transaction, so many clients
+writing at once cost one file write per group instead of one per change. A client gets the answer to a change
+only after it is saved, so its next request sees it. Everything runs in one thread; storages is never used by
+two requests at the same time.
+
+Client is the matching blocking client, and background() runs a server in a thread of this process (tests,
+load generation with load()).
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import batch
+import storages as storage
+
+ADDRESS = os.environ.get("CHECKMYGRADE_SERVER", "127.0.0.1:8765")
+
+
+def parse_address(address: str) -> Tuple[str, object]:
+    """("unix", path) or ("tcp", (host, port)) from "unix:/path" or "host:port"."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Bad server address: {address} (use host:port or unix:/path)")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class Server:
+    def __init__(self, group_max: int = batch.GROUP_MAX):
+        self.group_max = group_max
+        self.address: Optional[str] = None
+        self.counters = {"connections": 0, "open": 0, "reads": 0, "writes": 0, "write_groups": 0, "errors": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    # Loads every table, starts the writer task and listens on address. Returns the address actually used
+    # (with port 0 the system picks a free port).
+    async def start(self, address: str = ADDRESS) -> str:
+        for key in storage.FILES:
+            storage.count(key)
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+        kind, where = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.remove(where)  # left over from a server that did not shut down
+            self._server = await asyncio.start_unix_server(self._handle, path=where)
+            self.address = address
+        else:
+            self._server = await asyncio.start_server(self._handle, *where)
+            host, port = self._server.sockets[0].getsockname()[:2]
+            self.address = f"{host}:{port}"
+        return self.address
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            kind, where = parse_address(self.address)
+            if kind == "unix" and os.path.exists(where):
+                os.remove(where)
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    # The only place changes are made: takes everything that is queued and saves it as one group.
+    async def _write_loop(self):
+        while True:
+            group = [await self._queue.get()]
+            while len(group) < self.group_max and not self._queue.empty():
+                group.append(self._queue.get_nowait())
+            results = batch.execute_group([(line, op) for line, op, _ in group])
+            self.counters["write_groups"] += 1
+            for (_, _, done), r in zip(group, results):
+                done.set_result(r)
+
+    async def _answer(self, op: dict, line: int) -> dict:
+        if op.get("op") == "server_stats":
+            return {"line": line, "op": "server_stats", "ok": True, "result": dict(self.counters), "ms": 0.0}
+        if batch.is_mutation(op):
+            self.counters["writes"] += 1
+            done = asyncio.get_running_loop().create_future()
+            await self._queue.put((line, op, done))
+            return await done
+        self.counters["reads"] += 1
+        return batch.execute(op, line)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.counters["connections"] += 1
+        self.counters["open"] += 1
+        line = 0
+        try:
+            while True:
+                text = await reader.readline()
+                if not text:
+                    break
+                line += 1
+                try:
+                    op = json.loads(text)
+                    if not isinstance(op, dict):
+                        raise ValueError("each line must be a JSON object")
+                except ValueError as e:
+                    out = {"line": line, "op": None, "ok": False, "error": f"Bad JSON: {e}", "ms": 0.0}
+                else:
+                    out = await self._answer(op, line)
+                self.counters["errors"] += not out["ok"]
+                writer.write((json.dumps(out, default=str) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.counters["open"] -= 1
+            writer.close()
+
+
+def run(address: str = ADDRESS):
+    """Serves until interrupted (Ctrl+C)."""
+    async def main():
+        server = Server()
+        print(f"CheckMyGrade server on {await server.start(address)}", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+@contextmanager
+def background(address: str = "127.0.0.1:0", group_max: int = batch.GROUP_MAX):
+    """Runs a server in a thread of this process and yields it (server.address to connect). While it runs,
+    only the clients should use storages."""
+    loop = asyncio.new_event_loop()
+    server = Server(group_max)
+    loop.run_until_complete(server.start(address))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+class Client:
+    """Blocking client: Client(address).call("get_student", email="a@x.com") returns the result, or raises
+    ValueError with the server's error message."""
+
+    def __init__(self, address: str = ADDRESS, timeout: Optional[float] = 30):
+        kind, where = parse_address(address)
+        if kind == "unix":
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(where)
+        else:
+            self._sock = socket.create_connection(where, timeout=timeout)
+        self._file = self._sock.makefile("rwb")
+
+    def request(self, op: dict) -> dict:
+        """Sends one operation and returns the whole answer line."""
+        self._file.write((json.dumps(op) + "\n").encode("utf-8"))
+        self._file.flush()
+        text = self._file.readline()
+        if not text:
+            raise ConnectionError("The server closed the connection.")
+        return json.loads(text)
+
+    def call(self, name: str, **args):
+        out = self.request(dict(args, op=name))
+        if not out["ok"]:
+            raise ValueError(out["error"])
+        return out["result"]
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+'''Load generator: `clients` threads, each with its own connection, send `ops` operations each: every
+`write_every`-th one adds a student to course, the others alternate between a lookup of a student it added, a
+course report and the course statistics. The students are deleted again at the end.'''
+
+def load(address: str, clients: int = 8, ops: int = 100, write_every: int = 4, course: str = "LOAD100") -> Dict[str, float]:
+    """Returns {"ops", "errors", "seconds", "ops_per_second", "p50_ms", "p99_ms"} measured at the clients."""
+    times: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(n: int):
+        mine, local, bad = [], [], 0
+        with Client(address) as c:
+            for i in range(ops):
+                if i % write_every == 0 or not mine:
+                    email = f"load{n}_{i}_{os.getpid()}@example.com"
+                    op = {"op": "add_student", "email_address": email, "first_name": "Load", "last_name": str(n),
+                          "course_id": course, "grade": "B", "marks": 80 + i % 20}
+                    mine.append(email)
+                elif i % 3 == 0:
+                    op = {"op": "get_student", "email": mine[i % len(mine)]}
+                elif i % 3 == 1:
+                    op = {"op": "report_by_course", "course_id": course}
+                else:
+                    op = {"op": "course_statistics", "course_id": course}
+                start = time.perf_counter()
+                bad += not c.request(op)["ok"]
+                local.append(time.perf_counter() - start)
+            for email in mine:
+                c.request({"op": "delete_student", "email": email})
+        with lock:
+            times.extend(local)
+            errors[0] += bad
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - start
+    times.sort()
+    return {"ops": len(times), "errors": errors[0], "seconds": seconds,
+            "ops_per_second": len(times) / seconds if seconds else 0.0,
+            "p50_ms": times[len(times) // 2] * 1000 if times else 0.0,
+            "p99_ms": times[min(len(times) - 1, int(len(times) * 0.99))] * 1000 if times else 0.0}
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != "load":
+        print("Usage: python server.py load [address]   # without address a server is started in this process")
+        sys.exit(2)
+    if len(sys.argv) == 3:
+        result = load(sys.argv[2])
+    else:
+        with background() as server:
+            result = load(server.address)
+    for name, value in result.items():
+        print(f"{name:15s} {value:10.3f}")
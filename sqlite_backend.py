@@ -0,0 +1,150 @@
+"""SQLite storage backend (standard library sqlite3).
+
+Every table has the same columns as its CSV file, stored as text so rows come back exactly as the
+CSV backend returns them, plus hidden lower-case copies of the primary key ("_pk") and of the
+secondary index columns (ex: "_Course_id") with an index on each, so lookups by key and by course
+are indexed queries instead of full scans. The database runs in WAL mode, which lets readers keep
+reading while a writer commits.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend import Backend, ConflictError
+
+
+class SqliteBackend(Backend):
+    name = "sqlite"
+
+    def __init__(self, path: str, headers: Dict[str, List[str]], keys: Dict[str, str],
+                 secondary: Dict[str, Sequence[str]]):
+        self.path = path
+        self.headers = headers
+        self.keys = keys
+        self.secondary = secondary
+        # the connection may be handed to another thread (server.background()), but is only used by one at a time
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._depth = 0
+        for key, cols in headers.items():
+            hidden = ["_pk TEXT PRIMARY KEY"] + [f'"_{c}" TEXT' for c in secondary.get(key, ())]
+            columns = ", ".join(hidden + [f'"{c}" TEXT' for c in cols])
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{key}" ({columns})')
+            for c in secondary.get(key, ()):
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{key}__{c}" ON "{key}"("_{c}")')
+
+    def _select(self, key: str) -> str:
+        return "SELECT " + ", ".join(f'"{c}"' for c in self.headers[key]) + f' FROM "{key}"'
+
+    def _dicts(self, key: str, cursor) -> List[dict]:
+        cols = self.headers[key]
+        return [dict(zip(cols, values)) for values in cursor]
+
+    # Values for the hidden columns followed by the CSV columns, in table order.
+    def _values(self, key: str, row: dict) -> list:
+        return ([row[self.keys[key]].lower()] + [row.get(c, "").lower() for c in self.secondary.get(key, ())]
+                + [row.get(c, "") for c in self.headers[key]])
+
+    def find(self, key: str, value: str) -> Optional[dict]:
+        rows = self._dicts(key, self.conn.execute(self._select(key) + " WHERE _pk = ?", (value.lower(),)))
+        return rows[0] if rows else None
+
+    def rows(self, key: str) -> List[dict]:
+        return self._dicts(key, self.conn.execute(self._select(key) + " ORDER BY rowid"))
+
+    # The cursor fetches rows from SQLite as they are consumed, so stopping early stops the query.
+    def iter_rows(self, key: str) -> Iterator[dict]:
+        cols = self.headers[key]
+        for values in self.conn.execute(self._select(key) + " ORDER BY rowid"):
+            yield dict(zip(cols, values))
+
+    def where(self, key: str, col: str, value: str) -> List[dict]:
+        if col not in self.secondary.get(key, ()):
+            return super().where(key, col, value)
+        sql = self._select(key) + f' WHERE "_{col}" = ? ORDER BY rowid'
+        return self._dicts(key, self.conn.execute(sql, (value.lower(),)))
+
+    # instr() runs the substring test inside SQLite. Its lower() only knows ASCII letters, so other terms use the
+    # Python version.
+    def contains(self, key: str, col: str, value: str) -> List[dict]:
+        if not value.isascii():
+            return super().contains(key, col, value)
+        sql = self._select(key) + f' WHERE instr(lower("{col}"), ?) > 0 ORDER BY rowid'
+        return self._dicts(key, self.conn.execute(sql, (value,)))
+
+    def count(self, key: str) -> int:
+        return self.conn.execute(f'SELECT COUNT(*) FROM "{key}"').fetchone()[0]
+
+    def sorted_rows(self, key: str, by: str, numeric: bool, reverse: bool = False,
+                    offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        if by not in self.headers[key]:
+            return super().sorted_rows(key, by, numeric, reverse, offset, limit)
+        order = f'CAST("{by}" AS REAL)' if numeric else f'lower("{by}")'
+        sql = self._select(key) + f" ORDER BY {order} {'DESC' if reverse else 'ASC'}, rowid LIMIT ? OFFSET ?"
+        return self._dicts(key, self.conn.execute(sql, (-1 if limit is None else limit, offset)))
+
+    # PRAGMA data_version changes whenever another connection commits to the database (any table, so a write to
+    # one table also counts as a new version of the others). Our own commits do not change it.
+    def version(self, key: str) -> object:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # The version is checked after BEGIN IMMEDIATE has taken the write lock, so nobody can commit between the check
+    # and the write. Inserts are plain INSERTs: a key that exists already (added by another process after we
+    # looked) is refused by the primary key instead of replacing that row.
+    def apply(self, key: str, changes: List[Tuple[str, dict]], expected: object = None):
+        hidden = ["_pk"] + [f"_{c}" for c in self.secondary.get(key, ())]
+        cols = hidden + self.headers[key]
+        insert = f'INSERT INTO "{key}" (' + ", ".join(f'"{c}"' for c in cols) + ") VALUES (" + ", ".join("?" * len(cols)) + ")"
+        update = f'UPDATE "{key}" SET ' + ", ".join(f'"{c}" = ?' for c in cols[1:]) + " WHERE _pk = ?"
+        delete = f'DELETE FROM "{key}" WHERE _pk = ?'
+        with self.transaction():
+            if expected is not None and self.version(key) != expected:
+                raise ConflictError(f"The {key} table was changed by another process.")
+            # consecutive changes of the same kind go to the database in one executemany call
+            for op, group in groupby(changes, key=lambda c: c[0]):
+                if op == "D":
+                    self.conn.executemany(delete, [(row[self.keys[key]].lower(),) for _, row in group])
+                elif op == "U":
+                    self.conn.executemany(update, [self._values(key, row)[1:] + [row[self.keys[key]].lower()] for _, row in group])
+                else:
+                    try:
+                        self.conn.executemany(insert, [self._values(key, row) for _, row in group])
+                    except sqlite3.IntegrityError as e:
+                        raise ConflictError(f"The {key} table already has that {self.keys[key]}: {e}")
+
+    # The check and the write of a change run in one IMMEDIATE transaction, so other writers wait for it.
+    def write_lock(self, key: str):
+        return self.transaction()
+
+    @contextmanager
+    def transaction(self):
+        if self._depth:
+            yield
+            return
+        # IMMEDIATE takes the write lock at the start, so a transaction that reads and then writes cannot fail
+        # halfway because another process started writing in between (it waits for the lock instead)
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._depth = 1
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+        finally:
+            self._depth = 0
+
+    # VACUUM rebuilds the database file without the space left by deleted rows.
+    def compact(self, key: Optional[str] = None):
+        self.conn.execute("VACUUM")
+
+    def stats(self) -> Dict[str, object]:
+        counts = {key: self.count(key) for key in self.headers}
+        return {"backend": self.name, "path": self.path, "rows": counts}
+
+    def close(self):
+        self.conn.close()
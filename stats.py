@@ -0,0 +1,169 @@
+"""Course statistics computed in a single pass over the student rows, or kept up to date as rows change.
+
+Accumulator keeps a running count, mean and sum of squared differences (Welford's method, which
+stays accurate without a second pass over the data), min/max and a grade counter. The marks are
+also collected so the median and any percentile need one sort at the end instead of one per value.
+
+CourseAggregate is the version that can also remove a student: it keeps count, sum and sum of squares
+plus the marks in a sorted list (the order-statistics part), so the median or any percentile is an index
+into that list and nothing has to be recomputed when one student is added, changed or deleted.
+"""
+
+import bisect
+import math
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from models import StudentRow
+
+
+class Accumulator:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.grades: Dict[str, int] = {}
+        self.marks: List[float] = []
+
+    def add(self, marks: float, grade: str = ""):
+        self.count += 1
+        delta = marks - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (marks - self.mean)
+        self.min = min(self.min, marks)
+        self.max = max(self.max, marks)
+        self.grades[grade] = self.grades.get(grade, 0) + 1
+        self.marks.append(marks)
+
+    def result(self, percentiles: Sequence[float] = ()) -> Optional[dict]:
+        if not self.count:
+            return None
+        ordered = sorted(self.marks)
+        return {
+            "count": self.count,
+            "average": self.mean,
+            "median": percentile(ordered, 50),
+            "stddev": math.sqrt(self.m2 / self.count),
+            "min": self.min,
+            "max": self.max,
+            "percentiles": {p: percentile(ordered, p) for p in percentiles},
+            "grades": dict(sorted(self.grades.items())),
+        }
+
+
+# p-th percentile (0-100) of already sorted values, interpolating between the two closest values
+# (for p=50 this is the usual median: the middle value, or the average of the two middle values).
+def percentile(ordered: Sequence[float], p: float) -> float:
+    if not 0 <= p <= 100:
+        raise ValueError("Percentile must be between 0 and 100.")
+    pos = (len(ordered) - 1) * p / 100
+    low = math.floor(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def marks_of(row: dict) -> Optional[float]:
+    if isinstance(row, StudentRow):
+        return row.marks  # already parsed
+    try:
+        return float(row["Marks"])
+    except ValueError:
+        return None
+
+
+def summarize(rows: Iterable[dict], percentiles: Sequence[float] = ()) -> Optional[dict]:
+    acc = Accumulator()
+    for r in rows:
+        m = marks_of(r)
+        if m is not None:
+            acc.add(m, r["Grade"])
+    return acc.result(percentiles)
+
+
+# One scan over all students, grouped by Course_id (case-insensitive; the first spelling seen is used as the name).
+def summarize_by_course(rows: Iterable[dict], percentiles: Sequence[float] = ()) -> Dict[str, dict]:
+    groups: Dict[str, Accumulator] = {}
+    names: Dict[str, str] = {}
+    for r in rows:
+        m = marks_of(r)
+        if m is None:
+            continue
+        course = r["Course_id"].lower()
+        if course not in groups:
+            groups[course] = Accumulator()
+            names[course] = r["Course_id"]
+        groups[course].add(m, r["Grade"])
+    return {names[c]: acc.result(percentiles) for c, acc in groups.items()}
+
+
+class CourseAggregate:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.marks: List[float] = []
+        self.grades: Dict[str, int] = {}
+
+    # sort=False appends instead of inserting in order; the caller must sort self.marks afterwards.
+    def add(self, marks: float, grade: str = "", sort: bool = True):
+        self.count += 1
+        self.total += marks
+        self.total_sq += marks * marks
+        if sort:
+            bisect.insort(self.marks, marks)
+        else:
+            self.marks.append(marks)
+        self.grades[grade] = self.grades.get(grade, 0) + 1
+
+    def remove(self, marks: float, grade: str = ""):
+        self.count -= 1
+        self.total -= marks
+        self.total_sq -= marks * marks
+        del self.marks[bisect.bisect_left(self.marks, marks)]
+        self.grades[grade] -= 1
+        if not self.grades[grade]:
+            del self.grades[grade]
+
+    def result(self, percentiles: Sequence[float] = ()) -> Optional[dict]:
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        return {
+            "count": self.count,
+            "average": mean,
+            "median": percentile(self.marks, 50),
+            "stddev": math.sqrt(max(0.0, self.total_sq / self.count - mean * mean)),
+            "min": self.marks[0],
+            "max": self.marks[-1],
+            "percentiles": {p: percentile(self.marks, p) for p in percentiles},
+            "grades": dict(sorted(self.grades.items())),
+        }
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "count": self.count, "total": self.total, "total_sq": self.total_sq,
+                "marks": self.marks, "grades": self.grades}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CourseAggregate":
+        agg = cls(data["name"])
+        agg.count, agg.total, agg.total_sq = data["count"], data["total"], data["total_sq"]
+        agg.marks, agg.grades = data["marks"], data["grades"]
+        return agg
+
+
+# {lower-case Course_id: CourseAggregate} for a list of student rows.
+def aggregate_by_course(rows: Iterable[dict]) -> Dict[str, CourseAggregate]:
+    groups: Dict[str, CourseAggregate] = {}
+    for r in rows:
+        m = marks_of(r)
+        if m is None:
+            continue
+        course = r["Course_id"].lower()
+        if course not in groups:
+            groups[course] = CourseAggregate(r["Course_id"])
+        groups[course].add(m, r["Grade"], sort=False)
+    for agg in groups.values():
+        agg.marks.sort()
+    return groups
@@ -1,9 +1,22 @@
-import csv, os, time
-from typing import List, Tuple,  Dict, Optional, Callable
-from models import Student, Course, Professor, Grade
+import atexit, bisect, csv, itertools, json, marshal, os, random, time
+from contextlib import ExitStack, closing, contextmanager
+from typing import List, Tuple,  Dict, Optional, Callable, Iterable, Iterator, Sequence
+from models import Student, Course, Professor, Grade, StudentRow
+from backend import Backend, ConflictError, copy_tables, open_append, sort_key
+import join
+import metrics
+import query
+import stats
+from views import RosterView
 
+try:
+    import fcntl
+except ImportError:  # not on Windows; see _lock
+    fcntl = None
 
-DATA_DIR = os.path.join(os.path.dirname(__file__),"data")
+
+# CHECKMYGRADE_DATA=<folder> keeps the tables somewhere else (ex: bench.py runs on a throw-away copy).
+DATA_DIR = os.environ.get("CHECKMYGRADE_DATA", os.path.join(os.path.dirname(__file__),"data"))
 
 FILES = {
     "students": os.path.join(DATA_DIR, "students.csv"),
@@ -27,27 +40,461 @@ HEADERS ={
 #os.makedirs() creates a folder. DATA_DIR is the path for data folder. 
 # exist_ok = True means, if the folder already exist do not throw  error. just continue.
 #.items() let us loop over both the key (Ex: "student") and path (like 'data/students.csv')
+# It runs the first time a table is read (not when the module is imported), and only once.
+_files_ready = False
+
 
 def _ensure_files():
+    global _files_ready
+    if _files_ready:
+        return
     os.makedirs(DATA_DIR, exist_ok=True)
     for key, path in FILES.items():
         if not os.path.exists(path):
             with open(path, "w", newline="", encoding="utf-8") as f:
                 writer =csv.writer(f)
                 writer.writerow(HEADERS[key])       
+    _files_ready = True
 
+# Columns that hold numbers; they are sorted and compared as numbers.
+NUMERIC_COLUMNS = ("Marks", "Credits")
 
-_ensure_files()
+# Primary key column of every table. Keys are compared case-insensitively.
+KEYS = {
+    "students": "Email_address",
+    "courses": "Course_id",
+    "professors": "Professor_id",
+    "login": "User_id",
+    "grades": "Grade_id",
+}
 
 #CRUD Helpers
 
-def _read_all(key: str) -> List[dict]:
-    items = []
-    with open(FILES[key], newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            items.append(row)
-    return items
+# Table cache: every public function reads the tables, so instead of re-parsing the CSV each time
+# we keep the parsed rows in memory and only read the file again when it changed on disk.
+# A file "changed" when its signature (mtime, size, inode) is different from the one we saw when we loaded it,
+# which also catches edits made by another program or another app.py process.
+_cache: Dict[str, dict] = {}
+_cache_stats = {"hits": 0, "misses": 0, "streams": 0, "reload_time": 0.0}
+
+'''Append-only writes: rewriting the whole CSV for every add/update/delete makes each change O(n).
+Instead, a new row is appended to the end of the CSV, and updates/deletes are appended to a journal file
+next to it (ex: data/students.journal.csv) with an extra "Op" column:
+    U => the row replaces the stored row with the same key (override)
+    D => the row with that key is deleted (tombstone)
+Once the journal has rows, new inserts go there too ("I") so that the order of changes is kept.
+Reading a table = base CSV + journal applied in order. compact() folds the journal back into a clean CSV,
+and it runs by itself once the journal has COMPACT_AFTER entries.'''
+JOURNALS = {key: os.path.join(DATA_DIR, f"{key}.journal.csv") for key in FILES}
+COMPACT_AFTER = 1000
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+# Temporary file next to path, named after this process so two processes never write the same one.
+def _tmp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _table_signature(key: str):
+    _ensure_files()
+    return (_signature(FILES[key]), _signature(JOURNALS[key]))
+
+
+'''Primary-key index: a table is kept in memory as a dictionary {lower-case key: row} instead of a list.
+Python dictionaries remember insertion order, so iterating over it still gives the rows in file order,
+but get/exists/update/delete by key are O(1) and .lower() is called once per row when the file is loaded,
+not once per row on every call. If a key appears twice in a file, the later row wins (same as the journal).'''
+
+'''Secondary indexes: for the columns listed in SECONDARY we also keep {lower-case value: {primary key: row}},
+so "all students of DATA200" is one dictionary lookup instead of a scan over every student.
+They are built when a table is loaded and kept up to date by every add/update/delete after that.'''
+SECONDARY = {
+    "students": ("Course_id",),
+    "professors": ("Course_id",),
+}
+
+
+# Moves row `pk` from its old position in the secondary indexes to the new one (old or new may be None).
+def _reindex(entry: dict, pk: str, old: Optional[dict], new: Optional[dict]):
+    for col, index in entry["by"].items():
+        if old is not None and (new is None or old[col].lower() != new[col].lower()):
+            bucket = index[old[col].lower()]
+            del bucket[pk]
+            if not bucket:
+                del index[old[col].lower()]
+        if new is not None:
+            index.setdefault(new[col].lower(), {})[pk] = new
+    for col, index in entry.get("grams", {}).items():
+        before = old[col].lower() if old is not None else ""
+        after = new[col].lower() if new is not None else ""
+        if before == after:
+            continue
+        for g in _grams(before):
+            postings = index[g]
+            postings.discard(pk)
+            if not postings:
+                del index[g]
+        for g in _grams(after):
+            index.setdefault(g, set()).add(pk)
+    if "aggregates" in entry:
+        _reaggregate(entry["aggregates"], old, new)
+    for by, view in entry.get("sorted", {}).items():
+        kf = sort_key(by, by in NUMERIC_COLUMNS)
+        before = (kf(old), pk) if old is not None else None
+        after = (kf(new), pk) if new is not None else None
+        if before == after:
+            continue
+        if before is not None:
+            del view[bisect.bisect_left(view, before)]
+        if after is not None:
+            bisect.insort(view, after)
+
+
+'''Trigram index for "contains" searches: every lower-case value of the TEXT_INDEXED columns is cut into all its
+3-letter pieces ("samina" => sam, ami, min, ina) and we keep {piece: set of primary keys}. A row can only contain
+"mina" if it has both "min" and "ina", so intersecting those sets gives a small list of candidates, which the
+query then checks for real. Search terms shorter than 3 letters cannot use it. The index is built the first time
+it is needed (most runs never search) and then kept up to date by _reindex like the other indexes.'''
+TEXT_INDEXED = {
+    "students": ("First_name", "Last_name", "Email_address", "Course_id"),
+}
+GRAM = 3
+
+
+def _grams(text: str) -> set:
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def _contains(key: str, col: str, value: str) -> List[dict]:
+    entry = _load(key)
+    if "grams" not in entry:
+        entry["grams"] = {c: {} for c in TEXT_INDEXED[key]}
+        for pk, r in entry["rows"].items():
+            for c, index in entry["grams"].items():
+                for g in _grams(r[c].lower()):
+                    index.setdefault(g, set()).add(pk)
+    index = entry["grams"][col]
+    postings = [index.get(g) for g in _grams(value.lower())]
+    if not postings or any(p is None for p in postings):
+        return []
+    postings.sort(key=len)
+    found = set(postings[0]).intersection(*postings[1:])
+    rows = entry["rows"]
+    # sets have no order; sorting keeps the result the same from one run to the next
+    return [rows[pk] for pk in sorted(found)]
+
+
+'''Per-course aggregates: for the students table we keep a stats.CourseAggregate per course (count, sum, sum of
+squares, sorted marks, grade counts), built the first time statistics are asked for and then changed by _reindex
+on every add/update/delete, so course_statistics does not look at the students at all.
+They are also saved next to the data (data/students.aggregates.json) together with the signature of the files
+they were computed from; a later run whose files have the same signature loads them instead of recomputing.'''
+AGGREGATES_FILE = os.path.join(DATA_DIR, "students.aggregates.json")
+
+
+def _reaggregate(aggregates: Dict[str, stats.CourseAggregate], old: Optional[dict], new: Optional[dict]):
+    if old is not None and new is not None and all(old[c] == new[c] for c in ("Course_id", "Grade", "Marks")):
+        return
+    if old is not None and stats.marks_of(old) is not None:
+        course = old["Course_id"].lower()
+        aggregates[course].remove(stats.marks_of(old), old["Grade"])
+        if not aggregates[course].count:
+            del aggregates[course]
+    if new is not None and stats.marks_of(new) is not None:
+        course = new["Course_id"].lower()
+        if course not in aggregates:
+            aggregates[course] = stats.CourseAggregate(new["Course_id"])
+        aggregates[course].add(stats.marks_of(new), new["Grade"])
+
+
+def _aggregates() -> Dict[str, stats.CourseAggregate]:
+    entry = _load("students")
+    if "aggregates" not in entry:
+        saved = None
+        if os.path.exists(AGGREGATES_FILE):
+            with open(AGGREGATES_FILE, encoding="utf-8") as f:
+                saved = json.load(f)
+        if saved is not None and saved["sig"] == json.loads(json.dumps(entry["sig"])):
+            entry["aggregates"] = {c: stats.CourseAggregate.from_dict(d) for c, d in saved["courses"].items()}
+            entry["aggregates_saved"] = entry["sig"]
+        else:
+            entry["aggregates"] = stats.aggregate_by_course(entry["rows"].values())
+    return entry["aggregates"]
+
+
+# Saves the aggregates if they changed since they were loaded or last saved. Runs when the program exits.
+def _save_aggregates():
+    entry = _cache.get("students")
+    if entry is None or "aggregates" not in entry or entry.get("aggregates_saved") == entry["sig"]:
+        return
+    if _tx is not None and "students" in _tx:
+        return
+    data = {"sig": entry["sig"], "courses": {c: a.to_dict() for c, a in entry["aggregates"].items()}}
+    tmp = _tmp_path(AGGREGATES_FILE)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        metrics.add("bytes_written", f.tell())
+    os.replace(tmp, AGGREGATES_FILE)
+    entry["aggregates_saved"] = entry["sig"]
+
+
+atexit.register(_save_aggregates)
+
+
+'''Sorted views: the first time the students are sorted by a column we keep the sorted order as a list of
+(sort value, primary key) pairs. _reindex moves a row inside the list with bisect when it is added, changed or
+deleted, so the next sort_students call (ex: the next page of a leaderboard) is only a slice of that list.
+Rows with the same sort value are ordered by primary key.'''
+
+def _sorted_rows(key: str, by: str, reverse: bool, offset: int, limit: Optional[int]) -> List[dict]:
+    entry = _load(key)
+    views = entry.setdefault("sorted", {})
+    if by not in views:
+        kf = sort_key(by, by in NUMERIC_COLUMNS)
+        views[by] = sorted((kf(r), pk) for pk, r in entry["rows"].items())
+    view = views[by]
+    n = len(view)
+    end = n if limit is None else min(n, offset + limit)
+    if reverse:
+        picked = view[max(0, n - end):max(0, n - offset)][::-1]
+    else:
+        picked = view[offset:end]
+    rows = entry["rows"]
+    return [rows[pk] for _, pk in picked]
+
+
+# In memory, students are kept as compact models.StudentRow objects; the small tables stay dictionaries.
+# Either way the row is a new object, so the cache never shares a row with a caller. Columns missing from a short
+# line of the CSV (None) become "", and values past the last column are dropped.
+def _pack(key: str, row) -> dict:
+    return StudentRow(row) if key == "students" else {h: row.get(h) or "" for h in HEADERS[key]}
+
+
+# Applies one journal entry to the in-memory table and its indexes.
+def _apply(entry: dict, key: str, op: str, row: dict):
+    row = _pack(key, row)
+    rows = entry["rows"]
+    target = row[KEYS[key]].lower()
+    old = rows.get(target)
+    if op == "D":
+        if old is not None:
+            del rows[target]
+            _reindex(entry, target, old, None)
+    elif op == "I" or old is not None:
+        rows[target] = row
+        _reindex(entry, target, old, row)
+
+
+def _fold(key: str, rows: List[dict], entries: List[dict]) -> Dict[str, dict]:
+    pk = KEYS[key]
+    table = {"rows": {r[pk].lower(): _pack(key, r) for r in rows}, "by": {}}
+    for e in entries:
+        op = e.pop("Op")
+        _apply(table, key, op, e)
+    return table["rows"]
+
+
+def _make_entry(key: str, sig, rows: Dict[str, dict], journal: int) -> dict:
+    entry = {"sig": sig, "rows": rows, "journal": journal, "by": {col: {} for col in SECONDARY.get(key, ())}}
+    for pk, r in rows.items():
+        _reindex(entry, pk, None, r)
+    return entry
+
+
+def _load(key: str) -> dict:
+    # Tables changed inside a transaction hold changes that are not on disk yet, so they are not reloaded.
+    if _tx is not None and key in _tx:
+        return _cache[key]
+    sig = _table_signature(key)
+    entry = _cache.get(key)
+    if entry is not None and entry["sig"] == sig:
+        _cache_stats["hits"] += 1
+        metrics.add("cache_hits", 1)
+        return entry
+    _cache_stats["misses"] += 1
+    metrics.add("cache_misses", 1)
+    start = time.perf_counter()
+    snapshot = _read_snapshot(key, sig)
+    if snapshot is not None:
+        entry = _make_entry(key, sig, *snapshot)
+        entry["snapshot_saved"] = sig
+        metrics.add("rows_read", len(entry["rows"]))
+    else:
+        with _lock(key):
+            sig = _table_signature(key)  # again: a writer may have finished before we got the lock
+            with open(FILES[key], newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+            entries = []
+            if _signature(JOURNALS[key]) is not None:
+                with open(JOURNALS[key], newline="", encoding="utf-8") as f:
+                    entries = list(csv.DictReader(f))
+        entry = _make_entry(key, sig, _fold(key, rows, entries), len(entries))
+        metrics.add("rows_read", len(rows) + len(entries))
+        metrics.add("bytes_read", sum(s[1] for s in sig if s is not None))
+    _cache_stats["reload_time"] += time.perf_counter() - start
+    _cache[key] = entry
+    return entry
+
+
+'''Several processes (two app.py windows, a report running during data entry) can use data/ at the same time.
+Every table has a lock file (data/<table>.lock). Reading the CSV and its journal takes a shared lock, so any number
+of processes read together; appending, compacting and committing take an exclusive lock, so a reader never sees a
+half-written row and two writers never interleave. Whole files are still written to a temporary file and renamed.
+The locks are fcntl.flock locks; where fcntl does not exist (Windows) _lock does nothing.
+Locks are per process and re-entrant: asking again for a table this process already holds does not block, and asking
+for the exclusive lock while holding the shared one upgrades it until the inner block ends.'''
+LOCKS = {key: os.path.join(DATA_DIR, f"{key}.lock") for key in FILES}
+_held: Dict[str, list] = {}     # table -> [lock file, exclusive?, depth]
+
+
+@contextmanager
+def _lock(key: str, exclusive: bool = False):
+    if fcntl is None:
+        yield
+        return
+    held = _held.get(key)
+    if held is not None:
+        upgrade = exclusive and not held[1]
+        if upgrade:
+            fcntl.flock(held[0], fcntl.LOCK_EX)
+            held[1] = True
+        held[2] += 1
+        try:
+            yield
+        finally:
+            held[2] -= 1
+            if upgrade:
+                fcntl.flock(held[0], fcntl.LOCK_SH)
+                held[1] = False
+        return
+    _ensure_files()
+    f = open(LOCKS[key], "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        _held[key] = [f, exclusive, 1]
+        yield
+    finally:
+        _held.pop(key, None)
+        f.close()  # closing the file releases the lock
+
+
+'''Snapshots: parsing the CSV files is most of the work when the program starts. At exit, every table that was
+loaded is also saved as a binary snapshot (data/<table>.snapshot: the rows as tuples, in Python's marshal format)
+together with the signature of the CSV and journal it was read from. The next start loads the snapshot instead
+of parsing the CSV, but only while the files still have that signature: after any change, by this program or
+another one, the CSV is parsed as before. CHECKMYGRADE_SNAPSHOT=0 turns snapshots off.'''
+SNAPSHOTS = {key: os.path.join(DATA_DIR, f"{key}.snapshot") for key in FILES}
+USE_SNAPSHOTS = os.environ.get("CHECKMYGRADE_SNAPSHOT", "1") != "0"
+
+
+# ({lower-case key: row}, journal entries) from the snapshot of a table, or None when there is no usable one.
+def _read_snapshot(key: str, sig) -> Optional[Tuple[Dict[str, dict], int]]:
+    if not USE_SNAPSHOTS:
+        return None
+    try:
+        with open(SNAPSHOTS[key], "rb") as f:
+            raw = f.read()
+        metrics.add("bytes_read", len(raw))
+        data = marshal.loads(raw)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("sig") != sig or data.get("header") != HEADERS[key]:
+        return None
+    header, pk = HEADERS[key], KEYS[key]
+    rows = {}
+    for values in data["rows"]:
+        r = StudentRow.from_values(values) if key == "students" else dict(zip(header, values))
+        rows[r[pk].lower()] = r
+    return rows, data["journal"]
+
+
+def _save_snapshots():
+    if not USE_SNAPSHOTS:
+        return
+    for key, entry in list(_cache.items()):
+        if entry.get("snapshot_saved") == entry["sig"] or (_tx is not None and key in _tx):
+            continue
+        if entry["sig"] != _table_signature(key):
+            continue  # the files changed after we read them, so these rows are not what they hold
+        header = HEADERS[key]
+        data = {"sig": entry["sig"], "header": header, "journal": entry["journal"],
+                "rows": [tuple(r.get(h) for h in header) for r in entry["rows"].values()]}
+        tmp = _tmp_path(SNAPSHOTS[key])
+        with open(tmp, "wb") as f:
+            marshal.dump(data, f)
+            metrics.add("bytes_written", f.tell())
+        os.replace(tmp, SNAPSHOTS[key])
+        entry["snapshot_saved"] = entry["sig"]
+
+
+atexit.register(_save_snapshots)
+
+
+# The cached rows themselves. Only for reading inside this module; never hand these out or change them.
+def _rows(key: str):
+    return _load(key)["rows"].values()
+
+
+'''Streaming reads: a table that is not in the cache yet does not have to be loaded to be read once.
+While its journal is empty the CSV file is the whole table, so _stream() parses it one row at a time and a
+caller that stops early (a lookup that found its row, a search with a limit) never reads the rest of the file,
+and a full pass keeps only one row in memory. Only the first read of a version of the file is streamed: the
+next one loads the table into the cache, so repeated reads are served from memory like before. Tables that are
+cached, or that have journal entries to fold in, are read from the cache. Files written by this module never
+repeat a key, so the first match is the row. Streamed reads are counted as cache misses and as "streams".'''
+_streamed: Dict[str, tuple] = {}   # table -> signature of the files when they were last streamed
+
+
+# The shared lock is held until the stream is finished or closed.
+def _stream(key: str) -> Iterator[dict]:
+    _ensure_files()
+    n = 0
+    with _lock(key), open(FILES[key], newline="", encoding="utf-8") as f:
+        _streamed[key] = _table_signature(key)
+        _cache_stats["misses"] += 1
+        _cache_stats["streams"] += 1
+        metrics.add("cache_misses", 1)
+        try:
+            for r in csv.DictReader(f):
+                n += 1
+                yield _pack(key, r)
+        finally:
+            metrics.add("rows_read", n)
+            metrics.add("rows_scanned", n)
+            metrics.add("bytes_read", f.buffer.tell())  # read ahead in blocks, so a little more than parsed
+
+
+def _streamable(key: str) -> bool:
+    if key in _cache or _signature(JOURNALS[key]) is not None:
+        return False
+    return _streamed.get(key) != _table_signature(key)
+
+
+def _iter_rows(key: str) -> Iterator[dict]:
+    if _streamable(key):
+        return _stream(key)
+    # a list of the cached rows, so the caller may change the table while it iterates
+    rows = list(_rows(key))
+    metrics.add("rows_scanned", len(rows))
+    return iter(rows)
+
+
+# Hit/miss counters and the total time (seconds) spent re-parsing CSV files.
+def _cache_info() -> dict:
+    return dict(_cache_stats, tables=sorted(_cache))
+
+
+def _clear_cache():
+    _cache.clear()
+    _streamed.clear()
+    _cache_stats.update(hits=0, misses=0, streams=0, reload_time=0.0)
 
 # f => is the file object opened earlier (ex: students.csv). 
 # HEADER[key]=>  List of column names for that file (ex: "Email_address") 
@@ -58,45 +505,455 @@ EX: rows = [
     {"Email_address": "shaila@sjsu.edu", "First_name": "Shaila", "Last_name": "mery", "Course_id": "DATA200", "Grade": "B", "Marks": "85"}
 ]'''
 
-def _write_all(key: str, rows: List[dict]):
-    with open(FILES[key], "w", newline="", encoding="utf-8") as f:
+# Rewrites the whole table. We write to a temporary file first and then rename it over the real one,
+# so the CSV is never left half written. The journal is folded into these rows, so it is removed afterwards.
+def _write_tmp(key: str, rows: Iterable[dict]) -> str:
+    _ensure_files()
+    tmp = _tmp_path(FILES[key])
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
         # This line creates a writer object that knows what columns to expect (field name )
         writer = csv.DictWriter(f, fieldnames=HEADERS[key])
         writer.writeheader()
         for r in rows:
             writer.writerow(r)
+        metrics.add("bytes_written", f.tell())
+    return tmp
 
 
-# Here we are referring the Student class inside the add_student fn. 
-def add_student(s: Student):
-    rows = _read_all("students")
-    # Here email must be unique
-    # rows is a list of dictionaries which is representing all the students are already stored in the CSV file
+def _replace(key: str, tmp: str):
+    os.replace(tmp, FILES[key])
+    if os.path.exists(JOURNALS[key]):
+        os.remove(JOURNALS[key])
+
+
+# Writes a batch of changes (op is "I", "U" or "D") with one open/write and applies them to the cached table.
+# With expected (a table signature from version()), ConflictError is raised and nothing is written if the files
+# changed since then. Inside a transaction the changes are only applied to the cached table and kept for the commit,
+# where the check is made.
+def _append_many(key: str, changes: List[Tuple[str, dict]], expected=None):
+    if not changes:
+        return
+    if _tx is not None:
+        entry = _load(key)
+        for op, row in changes:
+            _apply(entry, key, op, row)
+        _tx.setdefault(key, []).extend(changes)
+        return
+    with _lock(key, exclusive=True):
+        if expected is not None and _table_signature(key) != expected:
+            raise ConflictError(f"The {key} table was changed by another process.")
+        entry = _load(key)
+        path = _write_changes(key, entry, changes)
+        for op, row in changes:
+            _apply(entry, key, op, row)
+        _written(key, entry, path, len(changes))
+        if entry["journal"] >= COMPACT_AFTER:
+            _compact(key)
+
+
+# Appends changes to the files of a table: to the end of the CSV while the journal is empty and they are all
+# inserts, to the journal otherwise. Returns the file written. The caller holds the exclusive lock.
+def _write_changes(key: str, entry: dict, changes: List[Tuple[str, dict]]) -> str:
+    if entry["journal"] == 0 and all(op == "I" for op, _ in changes):
+        path, fieldnames, out = FILES[key], HEADERS[key], [row for _, row in changes]
+    else:
+        path, fieldnames, out = JOURNALS[key], ["Op"] + HEADERS[key], [dict(row, Op=op) for op, row in changes]
+    new_file = not os.path.exists(path)
+    start = _signature(path)[1] if not new_file else 0
+    with open_append(path) as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(out)
+        metrics.add("bytes_written", f.tell() - start)
+    return path
+
+
+# After n changes were appended to path: the cached table now matches the files again.
+def _written(key: str, entry: dict, path: str, n: int):
+    entry["sig"] = _table_signature(key)
+    if path == JOURNALS[key]:
+        entry["journal"] += n
+
+
+# Folds the journal back into a clean CSV file. Without a key every table is compacted.
+def _compact(key: Optional[str] = None):
+    for k in ([key] if key else list(FILES)):
+        if _tx is not None and k in _tx:
+            continue  # its changes are not on disk yet; the commit compacts it if the journal got long enough
+        with _lock(k, exclusive=True):
+            entry = _load(k)
+            if entry["journal"]:
+                # same rows, so the cached table and its indexes stay; only the files change
+                _replace(k, _write_tmp(k, entry["rows"].values()))
+                entry["sig"] = _table_signature(k)
+                entry["journal"] = 0
+
+
+'''Transactions: inside "with storage.transaction():" nothing is written to disk. Changes are applied to the
+cached tables only (so reads inside the block already see them) and kept, in order, per changed table.
+When the block ends normally, the changes of every table are appended to its files with one write, like a single
+change outside a transaction (the CSV for inserts while the journal is empty, the journal otherwise), so committing
+a few changes does not rewrite whole tables. If one of the writes fails, the files already appended to are cut back
+to their old size, so either every table gets its changes or none does. Tables whose journal got long enough are
+compacted after the commit. If the block raises an exception, the cached tables are thrown away, so the next read
+loads the untouched files again and the exception is passed on. A transaction inside a transaction joins the outer one.
+The commit holds the exclusive locks of the changed tables (taken in name order, so two processes committing at
+once cannot wait on each other) and checks that no other process wrote them since they were read; if one did,
+ConflictError is raised and the transaction is rolled back like any other error.'''
+_tx: Optional[Dict[str, List[Tuple[str, dict]]]] = None   # table -> changes made in the transaction
+
+
+@contextmanager
+def _transaction():
+    global _tx
+    if _tx is not None:
+        yield
+        return
+    _tx = {}
+    try:
+        yield
+        with ExitStack() as locks:
+            for key in sorted(_tx):
+                locks.enter_context(_lock(key, exclusive=True))
+                if _table_signature(key) != _cache[key]["sig"]:
+                    raise ConflictError(f"The {key} table was changed by another process.")
+            before = {path: _signature(path) for key in _tx for path in (FILES[key], JOURNALS[key])}
+            written = {}
+            try:
+                for key, changes in _tx.items():
+                    written[key] = _write_changes(key, _cache[key], changes)
+            except BaseException:
+                for path, sig in before.items():
+                    if sig is None:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    elif _signature(path) != sig:
+                        os.truncate(path, sig[1])
+                raise
+            for key, path in written.items():
+                _written(key, _cache[key], path, len(_tx[key]))
+    except BaseException:
+        for key in _tx:
+            _cache.pop(key, None)
+        raise
+    finally:
+        changed, _tx = _tx, None
+    for key in changed:
+        if _cache[key]["journal"] >= COMPACT_AFTER:
+            _compact(key)
+
+
+def _find(key: str, value: str) -> Optional[dict]:
+    return _find_many(key, [value]).get(value.lower())
+
+
+# Lookups on a table that is not cached (and not streamed yet) read the file only until every key is found.
+# Writes load the table before they look anything up (see _change), so they never stream.
+def _find_many(key: str, values: Iterable[str]) -> Dict[str, dict]:
+    wanted = {v.lower() for v in values}
+    if not wanted:
+        return {}
+    if not _streamable(key):
+        rows = _load(key)["rows"]
+        return {v: rows[v] for v in wanted if v in rows}
+    pk = KEYS[key]
+    found = {}
+    with closing(_stream(key)) as rows:
+        for r in rows:
+            k = r[pk].lower()
+            if k in wanted and k not in found:
+                found[k] = r
+                if len(found) == len(wanted):
+                    break
+    return found
+
+
+# Rows whose `col` equals value (case-insensitive), through the secondary index of that column.
+def _where(key: str, col: str, value: str):
+    return _load(key)["by"][col].get(value.lower(), {}).values()
+
+
+class CsvBackend(Backend):
+    """The CSV files in DATA_DIR, with the table cache, journal and indexes above."""
+    name = "csv"
+
+    def find(self, key, value):
+        return _find(key, value)
+
+    def find_many(self, key, values):
+        return _find_many(key, values)
+
+    def rows(self, key):
+        rows = list(_rows(key))
+        metrics.add("rows_scanned", len(rows))
+        return rows
+
+    def iter_rows(self, key):
+        return _iter_rows(key)
+
+    def where(self, key, col, value):
+        if col not in SECONDARY.get(key, ()):
+            return super().where(key, col, value)
+        return list(_where(key, col, value))
+
+    def contains(self, key, col, value):
+        if col not in TEXT_INDEXED.get(key, ()) or len(value) < GRAM:
+            return super().contains(key, col, value)
+        return _contains(key, col, value)
+
+    def count(self, key):
+        return len(_load(key)["rows"])
+
+    def sorted_rows(self, key, by, numeric, reverse=False, offset=0, limit=None):
+        return _sorted_rows(key, by, reverse, offset, limit)
+
+    def course_statistics(self, course_id, percentiles=()):
+        agg = _aggregates().get(course_id.lower())
+        return agg.result(percentiles) if agg is not None else None
+
+    def all_course_statistics(self, percentiles=()):
+        return {a.name: a.result(percentiles) for a in _aggregates().values()}
+
+    # The signature of the CSV file and journal the cached rows were read from.
+    def version(self, key):
+        return _load(key)["sig"] if _tx is None else None
+
+    def apply(self, key, changes, expected=None):
+        _append_many(key, changes, expected)
+
+    def write_lock(self, key):
+        return _lock(key, exclusive=True)
+
+    def transaction(self):
+        return _transaction()
+
+    def compact(self, key=None):
+        _compact(key)
+
+    def stats(self):
+        return dict(_cache_info(), backend=self.name)
+
+    def clear_cache(self):
+        _clear_cache()
+
+
+'''Backend selection: the CSV files are the default. Setting the environment variable CHECKMYGRADE_BACKEND=sqlite
+(and optionally CHECKMYGRADE_DB=<path>, default data/checkmygrade.db) stores everything in SQLite instead;
+use_backend() switches while the program runs. A new SQLite database is filled from the CSV files the first time,
+and migrate_to_sqlite() copies the CSV data over again at any time.
+CHECKMYGRADE_BACKEND=partitioned keeps the students in one CSV file per course under data/students/ (see
+partitioned_backend.py; the first time it is split from students.csv). All functions below go through _backend.'''
+DB_PATH = os.environ.get("CHECKMYGRADE_DB", os.path.join(DATA_DIR, "checkmygrade.db"))
+PARTITION_DIR = os.path.join(DATA_DIR, "students")
+_backend: Backend = CsvBackend()
+_views: Optional[RosterView] = None   # see use_views()
+
+
+def _open_sqlite(path: str):
+    from sqlite_backend import SqliteBackend
+    return SqliteBackend(path, HEADERS, KEYS, SECONDARY)
+
+
+def use_backend(name: str = "csv", path: Optional[str] = None) -> Backend:
+    global _backend, _views
+    if name == "csv":
+        new = CsvBackend()
+    elif name == "sqlite":
+        path = path or DB_PATH
+        fresh = not os.path.exists(path)
+        new = _open_sqlite(path)
+        if fresh:
+            # several processes may all find no database; under the write lock only the first one fills it
+            with new.transaction():
+                if not any(new.count(key) for key in FILES):
+                    copy_tables(CsvBackend(), new, FILES, KEYS)
+    elif name == "partitioned":
+        from partitioned_backend import PartitionedBackend
+        new = PartitionedBackend(path or PARTITION_DIR, HEADERS, KEYS, CsvBackend())
+        if new.fresh:
+            new.apply("students", [("I", r) for r in CsvBackend().rows("students")])
+    else:
+        raise ValueError(f"Unknown storage backend: {name}")
+    _backend.close()
+    _backend = new
+    if _views is not None:
+        _views = RosterView(new)
+    return new
 
-    # r["Email_address"].lower() gets the email address from each record r, and converts it into a lowercase (to make comparison case- insensitive)
-    # s.email_address.lower() gets the email address from the new student object we are trying to add (s) and also makes it lower case
-    if any(r["Email_address"].lower() == s.email_address.lower( ) for r in rows):
-        raise ValueError("Student email must be unique and not null.")
-    rows.append({
+
+def backend() -> Backend:
+    return _backend
+
+
+def migrate_to_sqlite(path: Optional[str] = None) -> Dict[str, int]:
+    """Load every CSV table (journal included) into the SQLite database at path. Returns rows copied per table."""
+    db = _open_sqlite(path or DB_PATH)
+    try:
+        return copy_tables(CsvBackend(), db, FILES, KEYS)
+    finally:
+        db.close()
+
+
+if os.environ.get("CHECKMYGRADE_BACKEND", "csv") != "csv":
+    use_backend(os.environ["CHECKMYGRADE_BACKEND"])
+
+
+@contextmanager
+def transaction():
+    try:
+        with _backend.transaction():
+            yield
+    except BaseException:
+        if _views is not None:
+            _views.clear()  # it already follows changes that were just thrown away
+        raise
+    else:
+        if _views is not None:
+            _views.sync()
+
+
+def compact(key: Optional[str] = None):
+    """Fold pending changes back into clean storage. Without a key every table is compacted."""
+    _backend.compact(key)
+
+
+def cache_stats() -> dict:
+    """Cache counters of the current backend (hits, misses, streams, reload_time for CSV)."""
+    return _backend.stats()
+
+
+def clear_cache():
+    _backend.clear_cache()
+    if _views is not None:
+        _views.clear()
+
+
+# Callers are free to change the dictionaries they get back, so we hand out copies.
+def _read_all(key: str) -> List[dict]:
+    return [dict(r) for r in _backend.rows(key)]
+
+
+# Generators over every row of a table (copies, one at a time), ex: for s in iter_students(): ...
+# Nothing is read before the first row is asked for, and breaking out of the loop stops the read.
+def iter_table(key: str) -> Iterator[dict]:
+    if key not in FILES:
+        raise ValueError(f"Unknown table: {key}")
+    for r in _backend.iter_rows(key):
+        yield dict(r)
+
+
+def iter_students() -> Iterator[dict]:
+    return iter_table("students")
+
+
+'''Read-modify-write: every change is worked out from rows read first (is the key free? what is the row now?).
+If another process writes the table in between, the change would be based on rows that are gone. So _change()
+holds the backend's write lock of the table (Backend.write_lock: the exclusive file lock for CSV, the manifest lock
+for the partitioned students, BEGIN IMMEDIATE for SQLite) while it reads, checks and writes, and other writers wait
+instead of failing. The table version is still passed to apply() for backends without a write lock; if that check
+fails, everything is read and checked again, up to RETRIES times, with a short random pause before each try.
+prepare() does the reading and checking (raising ValueError if the change is not allowed) and returns the changes.'''
+RETRIES = 5
+
+
+def _change(key: str, prepare: Callable[[], List[Tuple[str, dict]]]) -> List[Tuple[str, dict]]:
+    for attempt in range(RETRIES):
+        try:
+            with _backend.write_lock(key):
+                version = _backend.version(key)
+                changes = prepare()
+                _backend.apply(key, changes, expected=version)
+        except ConflictError:
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+            continue
+        # outside the lock: the view reads the other tables, and holding one table's lock while waiting for
+        # another could deadlock with a transaction commit (which locks in name order)
+        if _views is not None:
+            _views.apply(key, changes, version)
+        return changes
+    raise ConflictError(f"The {key} table kept changing; gave up after {RETRIES} tries.")
+
+
+def _insert(key: str, row: dict, message: str):
+    def prepare():
+        if _backend.find(key, row[KEYS[key]]) is not None:
+            raise ValueError(message)
+        return [("I", row)]
+    _change(key, prepare)
+
+
+def _delete_row(key: str, value: str) -> bool:
+    def prepare():
+        r = _backend.find(key, value)
+        return [] if r is None else [("D", {KEYS[key]: r[KEYS[key]]})]
+    return bool(_change(key, prepare))
+
+
+# Applies **updates to a copy of the stored row (through the key_map of the calling function).
+def _updated(r: dict, updates: dict, key_map: Dict[str, str]) -> dict:
+    new = dict(r)
+    for k, v in updates.items():
+        if k in key_map:
+            new[key_map[k]] = str(v)
+    return new
+
+
+# Saves the updated row as an override.
+def _update_row(key: str, value: str, updates: dict, key_map: Dict[str, str]) -> bool:
+    def prepare():
+        r = _backend.find(key, value)
+        return [] if r is None else [("U", _updated(r, updates, key_map))]
+    return bool(_change(key, prepare))
+
+
+# Checks the keys of the whole batch against the table and against each other before anything is written,
+# so a bad batch is rejected as a whole.
+def _insert_many(key: str, rows: List[dict]) -> int:
+    pk = KEYS[key]
+    seen = set()
+    dup = []
+    for r in rows:
+        k = r[pk].lower()
+        if not k or k in seen:
+            dup.append(r[pk])
+        seen.add(k)
+    seen.discard("")
+
+    def prepare():
+        existing = _backend.find_many(key, seen)
+        bad = dup + [r[pk] for r in rows if r[pk].lower() in existing]
+        if bad:
+            raise ValueError(f"{pk} must be unique and not null: {', '.join(bad[:5])}")
+        return [("I", r) for r in rows]
+    _change(key, prepare)
+    return len(rows)
+
+
+def _student_row(s: Student) -> dict:
+    return {
         "Email_address": s.email_address,
         "First_name": s.first_name,
         "Last_name": s.last_name,
         "Course_id": s.course_id,
         "Grade": s.grade,
         "Marks": f"{float(s.marks):.2f}",
-        })
-    _write_all("students", rows)
+    }
+
+
+# Here we are referring the Student class inside the add_student fn. 
+def add_student(s: Student):
+    # Here email must be unique
+    # The backend looks the email up in its primary-key index, where every email is stored in lower case
+    # (to make comparison case- insensitive), so we do not have to go through all the students.
+    _insert("students", _student_row(s), "Student email must be unique and not null.")
 
 
 
 def delete_student(email: str):
-    rows = _read_all("students")
-    # making a new list that will include only records whose email does not match the one we are trying to delete.
-    new_rows = [r for r in rows if r["Email_address"].lower() != email.lower()]
-    # If the number of rows did not change after filtering (EX: Before 2 rows, after one rows => not same length, means student was found and deleted )
-    if len(new_rows) == len(rows):
+    # With CSV storage the student is not removed from the file right away; a delete (tombstone) entry is added to the journal.
+    if not _delete_row("students", email):
         raise ValueError("Student not found.")
-    _write_all("students", new_rows)
 
 # **updates means we can pass any number of keyword arguments (EX: update_student("sam@mycsu.edu", grade="B", marks=88.5))
 '''updates.items() when we call function like this, update_student("samina@sjsu.edu", grade="A", marks=90).
@@ -107,25 +964,106 @@ def delete_student(email: str):
 for the next pair ("marks", 90), it will become: r["Marks"] = "90"'''
 # str(v), when writing CSV files, everything should be stored as a text 
 
+STUDENT_KEY_MAP = {
+    "first_name": "First_name",
+    "last_name": "Last_name",
+    "course_id": "Course_id",
+    "grade": "Grade",
+    "marks": "Marks",
+}
+
+
 def update_student(email: str, **updates):
-    rows = _read_all("students")
-    found = False
-    for r in rows:
-        if r["Email_address"].lower() == email.lower():
-            found = True
-            for k, v in updates.items():
-                key_map = {
-                    "first_name": "First_name",
-                    "last_name": "Last_name",
-                    "course_id": "Course_id",
-                    "grade": "Grade",
-                    "marks": "Marks",
-                }
-                if k in key_map:
-                    r[key_map[k]] = str(v)
-    if not found:
+    if not _update_row("students", email, updates, STUDENT_KEY_MAP):
         raise ValueError("Student not found.")
-    _write_all("students", rows)
+
+
+# Bulk versions: the whole batch is validated first and then written with a single append.
+
+def add_students(students: Iterable[Student]) -> int:
+    return _insert_many("students", [_student_row(s) for s in students])
+
+
+def delete_students(emails: Iterable[str]) -> int:
+    targets = {e.lower(): e for e in emails}
+
+    def prepare():
+        missing = [e for e in targets.values() if _backend.find("students", e) is None]
+        if missing:
+            raise ValueError(f"Student not found: {', '.join(missing[:5])}")
+        return [("D", {"Email_address": e}) for e in targets.values()]
+    return len(_change("students", prepare))
+
+
+# updates maps an email to the fields to change, ex: {"sam@mycsu.edu": {"grade": "B", "marks": 88.5}}
+def update_students(updates: Dict[str, dict]) -> int:
+    def prepare():
+        rows = {e: _backend.find("students", e) for e in updates}
+        missing = [e for e, r in rows.items() if r is None]
+        if missing:
+            raise ValueError(f"Student not found: {', '.join(missing[:5])}")
+        return [("U", _updated(rows[e], u, STUDENT_KEY_MAP)) for e, u in updates.items()]
+    return len(_change("students", prepare))
+
+
+# Makes a table hold exactly `rows` (ex: binstore.to_csv writing a binary copy back): rows whose key is gone are
+# deleted, changed rows are updated and new keys are inserted, all as one change checked against the table version
+# like any other, on every backend. Returns the number of rows the table has afterwards.
+def replace_table(key: str, rows: Iterable[dict]) -> int:
+    if key not in FILES:
+        raise ValueError(f"Unknown table: {key}")
+    pk, header = KEYS[key], HEADERS[key]
+    new = {}
+    for r in rows:
+        row = {h: r.get(h) or "" for h in header}
+        k = row[pk].lower()
+        if not k or k in new:
+            raise ValueError(f"{pk} must be unique and not null: {row[pk]}")
+        new[k] = row
+
+    def prepare():
+        old = {r[pk].lower(): r for r in _backend.iter_rows(key)}
+        changes = [("D", {pk: r[pk]}) for k, r in old.items() if k not in new]
+        for k, row in new.items():
+            if k not in old:
+                changes.append(("I", row))
+            elif any(old[k][h] != row[h] for h in header):
+                changes.append(("U", row))
+        return changes
+    _change(key, prepare)
+    return len(new)
+
+
+'''import_csv reads another CSV with the same columns as the table (extra columns are ignored) row by row
+and adds all of its rows in one batch. export_csv writes the current table out. Both return the number of rows.'''
+
+def import_csv(key: str, path: str) -> int:
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [h for h in HEADERS[key] if h not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path} is missing column(s): {', '.join(missing)}")
+        for r in reader:
+            row = {h: r[h] or "" for h in HEADERS[key]}
+            if key == "students":
+                try:
+                    row["Marks"] = f"{float(row['Marks']):.2f}"
+                except ValueError:
+                    raise ValueError(f"{path} line {reader.line_num}: Marks must be a number.")
+            rows.append(row)
+    return _insert_many(key, rows)
+
+
+def export_csv(key: str, path: str) -> int:
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=HEADERS[key])
+        writer.writeheader()
+        for r in _backend.iter_rows(key):
+            writer.writerow(r)
+            n += 1
+    return n
 
 
 # predict is a function parameter which is a function that decides whether a student record matches the search condition. 
@@ -139,43 +1077,103 @@ search_students(lambda r: term in r["First_name"].lower()), here for each record
 '''elapsed = time.perf_counter() - start, when the loop finises it calculates the time difference, which means that how long the search took.'''
 '''results => returns a list of matching students. elapsed => returns, how long the search took'''
 
-def search_students(predicate)->Tuple[List[dict], float]:
+'''search_students also accepts a declarative query from query.py (ex: eq("Course_id", "DATA200") & between("Marks", 90, 100)).
+A query is planned: equality on the email or on Course_id is answered from an index and only those rows are checked,
+and so is "contains" on a name, the email or Course_id (trigram index, terms of 3+ letters); anything else is a scan. A lambda still works and is always a scan. limit stops as soon as enough rows are found
+(or keeps only the first `limit` rows after sorting when order_by is given).'''
+
+def search_students(predicate, limit: Optional[int] = None, order_by: Optional[str] = None,
+                    reverse: bool = False) -> Tuple[List[dict], float]:
     start = time.perf_counter()
-    rows= _read_all("students")
-    results = [r for r in rows if predicate(r)]
+    results = select("students", predicate, order_by=order_by, reverse=reverse, limit=limit)
     elapsed = time.perf_counter() - start
     return results, elapsed
 
-def sort_students(by: str= "Marks", reverse: bool = False):
-    start = time.perf_counter()
-    rows = _read_all("students")
-    if by == "Marks":
-        rows.sort(key=lambda r: float(r["Marks"]), reverse=reverse)
+
+def _sort_key(by: str):
+    return sort_key(by, by in NUMERIC_COLUMNS)
+
+
+def select(key: str, where=None, order_by: Optional[str] = None, reverse: bool = False,
+           limit: Optional[int] = None) -> List[dict]:
+    """Rows of any table matching `where` (a query.Query, a lambda, or None for all rows), as copies."""
+    early = limit if order_by is None else None
+    if where is None:
+        rows = list(itertools.islice(_backend.iter_rows(key), early))
+    elif isinstance(where, query.Query):
+        rows = query.run(_backend, key, KEYS[key], SECONDARY.get(key, ()), TEXT_INDEXED.get(key, ()), where, limit=early)
     else:
-        rows.sort(key=lambda r: r.get(by, "").lower(), reverse=reverse)
+        rows = []
+        for r in _backend.iter_rows(key):
+            if where(r):
+                rows.append(r)
+                if early is not None and len(rows) >= early:
+                    break
+    if order_by is not None:
+        rows = sorted(rows, key=_sort_key(order_by), reverse=reverse)
+        if limit is not None:
+            rows = rows[:limit]
+    return [dict(r) for r in rows]
+
+
+# Which access path a query would use on a table: "primary key", "index Course_id", "union(...)" or "scan".
+def explain(key: str, q: "query.Query") -> str:
+    return query.explain(query.plan(q, KEYS[key], SECONDARY.get(key, ()), TEXT_INDEXED.get(key, ())))
+
+
+# limit/offset return one page of the sorted students (ex: limit=20 for the top 20, offset=20 for the next 20).
+def sort_students(by: str= "Marks", reverse: bool = False, limit: Optional[int] = None, offset: int = 0):
+    start = time.perf_counter()
+    rows = [dict(r) for r in _backend.sorted_rows("students", by, by in NUMERIC_COLUMNS, reverse, offset, limit)]
     elapsed = time.perf_counter() - start
     return rows, elapsed
 
+
+def count(key: str) -> int:
+    """Number of rows in a table."""
+    return _backend.count(key)
+
+
+'''Sorting tables bigger than memory: iter_sorted() reads the table as a stream and sorts it with extsort.py.
+Up to EXTERNAL_SORT_AFTER rows are sorted in memory; a bigger table is cut into sorted runs of that many rows,
+spilled to temporary files and merged, so memory stays bounded by one run whatever the size of the table.
+The limit can be set with the environment variable CHECKMYGRADE_EXTERNAL_SORT_AFTER.'''
+EXTERNAL_SORT_AFTER = int(os.environ.get("CHECKMYGRADE_EXTERNAL_SORT_AFTER", 1_000_000))
+
+
+def iter_sorted(key: str, by: str, reverse: bool = False) -> Iterator[dict]:
+    """Every row of a table ordered by column `by`, one at a time (copies)."""
+    if by not in HEADERS.get(key, ()):
+        raise ValueError(f"Unknown column for {key}: {by}")
+    import extsort  # only needed here; it pulls in tempfile
+    for r in extsort.sort_rows(_backend.iter_rows(key), by, by in NUMERIC_COLUMNS, reverse, EXTERNAL_SORT_AFTER):
+        yield dict(r)
+
+
+# Writes the table to a CSV file in sorted order, row by row. Returns the number of rows.
+def export_sorted(key: str, path: str, by: str, reverse: bool = False) -> int:
+    n = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=HEADERS[key])
+        writer.writeheader()
+        for r in iter_sorted(key, by, reverse):
+            writer.writerow(r)
+            n += 1
+    return n
+
 #course
 def add_course(c: Course):
-    rows =_read_all("courses")
-    if any (r["Course_id"].lower() == c.course_id.lower() for r in rows):
-        raise ValueError("Course_id must be unique and not null.")
-    rows.append({
+    _insert("courses", {
         "Course_id": c.course_id,
         "Course_name": c.course_name,
         "Description": c.description,
         "Credits": str(c.credits)
-    })
-    _write_all("courses", rows)
+    }, "Course_id must be unique and not null.")
 
 
 def delete_course(course_id: str):
-    rows =_read_all("courses")
-    new_rows = [r for r in rows if r["Course_id"].lower() != course_id.lower()]
-    if len(new_rows)==len(rows):
+    if not _delete_row("courses", course_id):
         raise ValueError("Course not found.")
-    _write_all("courses", new_rows)
 
 '''''if k in key_map,  checks whether the update field (ex: course_name) is a valid key in key_map.
 
@@ -185,161 +1183,215 @@ key_map[k] gets the exact CSV column name.
 v is the new value passed. str(v),  converts it to a string (because CSVs store text)'''
 
 def update_course(course_id: str, **updates):
-    rows= _read_all("courses")
-    found =False
-    for r in rows:
-        if r["Course_id"].lower()== course_id.lower():
-            found = True
-            for k, v in updates.items():
-                key_map = {
-                    "course_name": "Course_name",
-                    "description": "Description",
-                    "credits": "Credits"
-                }
-                if k in key_map:
-                    r[key_map[k]] = str(v)
-    if not found:
+    key_map = {
+        "course_name": "Course_name",
+        "description": "Description",
+        "credits": "Credits"
+    }
+    if not _update_row("courses", course_id, updates, key_map):
         raise ValueError("Course not found.")
-    _write_all("courses", rows)
 
 
 
 #professors
 
 def add_professor(p: Professor):
-    rows= _read_all("professors")
-    if any (r["Professor_id"].lower()== p.professor_id.lower() for r in rows):
-        raise ValueError("Professor_id must be unique and not null.")
-    rows.append({
+    _insert("professors", {
         "Professor_id": p.professor_id,
         "Professor_Name": p.name,
         "Rank": p.rank,
         "Course_id": p.course_id,
-    })
-    _write_all("professors", rows)
+    }, "Professor_id must be unique and not null.")
 
 
 def delete_professor(professor_id: str):
-    rows = _read_all("professors")
-    new_rows = [r for r in rows if r["Professor_id"].lower() != professor_id.lower()]
-    if len(new_rows) == len(rows):
+    if not _delete_row("professors", professor_id):
         raise ValueError("Professor not found.")
-    _write_all("professors", new_rows) 
 
 
 
 def update_professor(professor_id: str, **updates):
-    rows = _read_all("professors")
-    found = False
-    for r in rows:
-        if r["Professor_id"].lower() == professor_id.lower():
-            found = True
-            for k, v in updates.items():
-                key_map = {
-                    "name": "Professor_Name",
-                    "rank": "Rank",
-                    "course_id": "Course_id",
-                }
-                if k in key_map:
-                    r[key_map[k]] = str(v)
-    if not found:
+    key_map = {
+        "name": "Professor_Name",
+        "rank": "Rank",
+        "course_id": "Course_id",
+    }
+    if not _update_row("professors", professor_id, updates, key_map):
         raise ValueError("Professor not found.")
-    _write_all("professors", rows)
 
 #grades
 
-def add_grade(g: Grade):
-    rows= _read_all("grades")
-    if any (r["Grade_id"].lower()== g.grade_id.lower() for r in rows):
-        raise ValueError("Grade_id must be unique and not null.")
-    rows.append({
+def _grade_row(g: Grade) -> dict:
+    return {
         "Grade_id": g.grade_id,
         "Grade": g.grade,
         "Marks_range": g.marks_range,
-    })
-    _write_all("grades", rows)
+    }
+
+
+def add_grade(g: Grade):
+    _insert("grades", _grade_row(g), "Grade_id must be unique and not null.")
+
+
+# Adds the grades whose Grade_id is not in the table yet, all in one write (ex: the default grade scale on start).
+# Returns how many were added; grades that already exist are left as they are.
+def seed_grades(grades: Iterable[Grade]) -> int:
+    grades = list(grades)
+    existing = _backend.find_many("grades", [g.grade_id for g in grades])
+    missing = [g for g in grades if g.grade_id.lower() not in existing]
+    if not missing:
+        return 0
+    return _insert_many("grades", [_grade_row(g) for g in missing])
 
 
 def delete_grade(grade_id: str):
-    rows = _read_all("grades")
-    new_rows = [r for r in rows if r["Grade_id"].lower() != grade_id.lower()]
-    if len(new_rows) == len(rows):
+    if not _delete_row("grades", grade_id):
         raise ValueError("Grade not found.")
-    _write_all("grades", new_rows)  
 
 
 def update_grade(grade_id: str, **updates):
-    rows = _read_all("grades")
-    found = False
-    for r in rows:
-        if r["Grade_id"].lower() == grade_id.lower():
-            found = True
-            for k, v in updates.items():
-                key_map = {
-                    "grade": "Grade",
-                    "marks_range": "Marks_range",
-                }
-                if k in key_map:
-                    r[key_map[k]] = str(v)
-    if not found:
+    key_map = {
+        "grade": "Grade",
+        "marks_range": "Marks_range",
+    }
+    if not _update_row("grades", grade_id, updates, key_map):
         raise ValueError("Grade not found.")
-    _write_all("grades", rows)
 
 
 # login
 
 def add_login(user_id: str, password_token: str, role: str):
-    rows = _read_all("login")
-    if any(r["User_id"].lower() == user_id.lower() for r in rows):
-        raise ValueError("User_id must be unique and not null.")
-    rows.append({"User_id": user_id, "Password": password_token, "Role": role})
-    _write_all("login", rows)
+    _insert("login", {"User_id": user_id, "Password": password_token, "Role": role},
+            "User_id must be unique and not null.")
 
 
 def get_login(user_id: str):
-    rows = _read_all("login")
-    for r in rows:
-        if r["User_id"].lower() == user_id.lower():
-            return r
-    return None
+    r = _backend.find("login", user_id)
+    return dict(r) if r is not None else None
+
+
+# Lookups by primary key for the other tables, same as get_login. They return None when the key does not exist.
+def get_student(email: str):
+    r = _backend.find("students", email)
+    return dict(r) if r is not None else None
+
+
+def get_course(course_id: str):
+    r = _backend.find("courses", course_id)
+    return dict(r) if r is not None else None
+
+
+def get_professor(professor_id: str):
+    r = _backend.find("professors", professor_id)
+    return dict(r) if r is not None else None
+
+
+def get_grade(grade_id: str):
+    r = _backend.find("grades", grade_id)
+    return dict(r) if r is not None else None
 
 
 def update_login(user_id: str, **updates):
-    rows = _read_all("login")
-    found = False
-    for r in rows:
-        if r["User_id"].lower() == user_id.lower():
-            found = True
-            for k, v in updates.items():
-                key_map = {"password": "Password", "role": "Role"}
-                if k in key_map:
-                    r[key_map[k]] = str(v)
-    if not found:
+    key_map = {"password": "Password", "role": "Role"}
+    if not _update_row("login", user_id, updates, key_map):
         raise ValueError("User not found.")
-    _write_all("login", rows)
 
 
 # Reports and stats
 
-def course_statistics(course_id: str):
-    rows = _read_all("students")
-    marks = [float(r["Marks"]) for r in rows if r["Course_id"].lower() == course_id.lower()]
-    if not marks:
-        return None
-    avg = sum(marks) / len(marks)
-    med = sorted(marks)[len(marks)//2] if len(marks)%2==1 else (sorted(marks)[len(marks)//2-1] + sorted(marks)[len(marks)//2]) / 2
-    return {"count": len(marks), "average": avg, "median": med}
+# count, average, median, stddev, min, max, the requested percentiles (ex: (25, 75, 90)) and how many of each grade
+# (see stats.py). None when the course has no students. The CSV backend answers from per-course running totals.
+def course_statistics(course_id: str, percentiles: Sequence[float] = ()):
+    return _backend.course_statistics(course_id, percentiles)
+
+
+# The same numbers for every course, from a single scan of the students: {Course_id: statistics}.
+def all_course_statistics(percentiles: Sequence[float] = ()) -> Dict[str, dict]:
+    return _backend.all_course_statistics(percentiles)
 
 def report_by_course(course_id: str):
-    rows = _read_all("students")
-    return [r for r in rows if r["Course_id"].lower() == course_id.lower()] 
+    return [dict(r) for r in _backend.where("students", "Course_id", course_id)]
 
+# Professor_id is the key of professors.csv, so a professor is one row and teaches the course in that row.
 def report_by_professor(professor_id: str):
-    pros = _read_all("professors")
-    courses = [p["Course_id"] for p in pros if p["Professor_id"].lower() == professor_id.lower()]
-    rows = _read_all("students")
-    return [r for r in rows if r["Course_id"] in courses]
+    p = _backend.find("professors", professor_id)
+    if p is None:
+        return []
+    return [dict(r) for r in _backend.where("students", "Course_id", p["Course_id"])]
 
 def report_by_student(email: str):
-    rows = _read_all("students")
-    return [r for r in rows if r["Email_address"].lower() == email.lower()]
\ No newline at end of file
+    r = _backend.find("students", email)
+    return [dict(r)] if r is not None else []
+
+
+# Rows of table `left` (all, or those matching where) joined with the rows of `right` on a column, through a
+# hash table of `right` (see join.hash_join; keep the smaller table on the right).
+# Ex: join_tables("students", "courses", "Course_id") gives every student with the course name and credits.
+def join_tables(left: str, right: str, on: str, right_on: Optional[str] = None, how: str = "inner",
+                where=None) -> List[dict]:
+    for key in (left, right):
+        if key not in FILES:
+            raise ValueError(f"Unknown table: {key}")
+    rows = select(left, where) if where is not None else _backend.iter_rows(left)
+    return list(join.hash_join(rows, _backend.iter_rows(right), on, right_on, how))
+
+
+'''Roster reports: the students of a course with the course name and credits and the professors teaching it
+(columns join.ROSTER_COLUMNS after the student columns; several professors are joined with "; " in Professor_id
+order), one row per student ordered by email. The order is fixed, not the order the rows happen to be stored in,
+so the view, a fresh join and every backend give the same list.
+They are built from the Course_id indexes of students and professors on every call, or read from the
+materialized view (views.py) after use_views(), which keeps every roster ready and follows each change.'''
+
+def use_views(enabled: bool = True):
+    global _views
+    _views = RosterView(_backend) if enabled else None
+
+
+def views_enabled() -> bool:
+    return _views is not None
+
+
+if os.environ.get("CHECKMYGRADE_VIEWS", "0") != "0":
+    use_views()
+
+
+def course_roster(course_id: str) -> List[dict]:
+    if _views is not None:
+        rows = _views.rows(course_id)
+    else:
+        course = _backend.find("courses", course_id)
+        rows = list(join.roster(_backend.where("students", "Course_id", course_id), [course] if course else [],
+                                _backend.where("professors", "Course_id", course_id)))
+    rows.sort(key=lambda r: r["Email_address"].lower())
+    return rows
+
+
+# The roster of the professor's course, with only this professor in the professor columns.
+def professor_roster(professor_id: str) -> List[dict]:
+    p = _backend.find("professors", professor_id)
+    if p is None:
+        return []
+    rows = course_roster(p["Course_id"])
+    mine = join.professor_columns([p])
+    for r in rows:
+        r.update(mine)
+    return rows
+
+# Operation metrics (see metrics.py), with the cache counters of the backend and the cache hit rate.
+def performance() -> dict:
+    data = metrics.snapshot()
+    cache = cache_stats()
+    lookups = cache.get("hits", 0) + cache.get("misses", 0)
+    data["cache"] = dict(cache, hit_rate=cache["hits"] / lookups if lookups else None)
+    return data
+
+
+'''Every public function above records its calls in metrics. The generators (iter_*) are left out, since their
+work happens after they return, and so are the functions that only hand out a backend or a context manager.'''
+NOT_MEASURED = {"backend", "transaction", "performance", "views_enabled"}
+for _name, _fn in list(globals().items()):
+    if (callable(_fn) and not isinstance(_fn, type) and getattr(_fn, "__module__", None) == __name__
+            and not _name.startswith(("_", "iter_")) and _name not in NOT_MEASURED):
+        globals()[_name] = metrics.instrument(_name, _fn)
+del _name, _fn
@@ -1,7 +1,16 @@
-import unittest, random, string
-from models import Student, Course, Professor, Grade
+import unittest, random, string, os, sys, subprocess, tempfile, io, json
+from models import Student, Course, Professor, Grade, StudentRow
 import storages as storage
+import analytics
+import batch
+import bench
+import binstore
+import extsort
+import metrics
+import partitioned_backend
+import server
 from security import encrypt_password, decrypt_password
+from query import eq, prefix, contains, between, any_of
 
 
 def rand_email(prefix="user"):
@@ -82,6 +91,810 @@ class TestCheckMyGrade(unittest.TestCase):
         print(f"Persistence search time: {t:.6f}s (found {len(results)} record(s))")
         self.assertGreaterEqual(len(results), 1)
 
+    @unittest.skipUnless(storage.backend().name == "csv", "CSV backend only")
+    def test_table_cache_reloads_changed_file(self):
+        storage.get_login("nobody@example.com")
+        storage.get_login("nobody@example.com")  # the first read of the file may be streamed; this one loads it
+        hits = storage.cache_stats()["hits"]
+        storage.get_login("nobody@example.com")
+        self.assertEqual(storage.cache_stats()["hits"], hits + 1)
+
+        # another program appends a row behind our back; the cache must notice
+        uid = rand_email("ext")
+        with open(storage.FILES["login"], "a", newline="", encoding="utf-8") as f:
+            f.write(f"{uid},{encrypt_password('pw')},student\n")
+        self.assertIsNotNone(storage.get_login(uid))
+
+    @unittest.skipUnless(storage.backend().name == "csv", "CSV backend only")
+    def test_append_only_writes_and_compaction(self):
+        storage.compact("students")
+        size = os.path.getsize(storage.FILES["students"])
+        email = rand_email("j")
+        storage.add_student(Student(email, "Jo", "Doe", "DATA200", "B", 81))
+        # with an empty journal an insert is one row appended to the CSV
+        with open(storage.FILES["students"], newline="", encoding="utf-8") as f:
+            f.seek(size)
+            self.assertTrue(f.read().startswith(email))
+
+        storage.update_student(email, marks=77)
+        self.assertTrue(os.path.exists(storage.JOURNALS["students"]))
+        storage.clear_cache()
+        self.assertEqual(storage.report_by_student(email)[0]["Marks"], "77")
+
+        storage.compact("students")
+        self.assertFalse(os.path.exists(storage.JOURNALS["students"]))
+        storage.clear_cache()
+        self.assertEqual(storage.report_by_student(email)[0]["Marks"], "77")
+
+    def test_append_after_file_without_final_line_break(self):
+        cid, other = ("NL" + rand_email("c")[2:6].upper() + n for n in ("A", "B"))
+        storage.add_course(Course(cid, "Newline", "d", 3))
+        if storage.backend().name == "csv":
+            storage.compact("courses")
+            path = storage.FILES["courses"]
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(path, "wb") as f:
+                f.write(data.rstrip(b"\r\n"))  # as left by an editor that drops the last line break
+        storage.add_course(Course(other, "Newline", "d", 4))
+        storage.clear_cache()
+        self.assertEqual(storage.get_course(cid)["Credits"], "3")
+        self.assertEqual(storage.get_course(other)["Credits"], "4")
+        storage.delete_course(cid)
+        storage.delete_course(other)
+
+    @unittest.skipUnless(storage.backend().name == "csv", "CSV backend only")
+    def test_short_csv_line(self):
+        # a hand-edited line (or one cut short by a crash) with missing columns does not break the table
+        email, uid = rand_email("short"), rand_email("short")
+        with open(storage.FILES["students"], "a", newline="", encoding="utf-8") as f:
+            f.write(f"{email},Bo\r\n")
+        with open(storage.FILES["login"], "a", newline="", encoding="utf-8") as f:
+            f.write(f"{uid}\r\n")
+        storage.clear_cache()
+        self.assertGreater(storage.count("students"), 0)
+        row = storage.get_student(email)
+        self.assertEqual((row["First_name"], row["Course_id"], row["Marks"]), ("Bo", "", ""))
+        self.assertEqual(storage.get_login(uid)["Role"], "")
+        storage.update_student(email, course_id="SHORT100", marks=50)
+        self.assertEqual(storage.report_by_course("SHORT100")[0]["Marks"], "50")
+        storage.delete_student(email)
+
+    def test_primary_key_lookups_are_case_insensitive(self):
+        email = rand_email("pk")
+        storage.add_student(Student(email, "Pat", "Key", "DATA200", "C", 72))
+        with self.assertRaises(ValueError):
+            storage.add_student(Student(email.upper(), "Pat", "Key", "DATA200", "C", 72))
+        self.assertEqual(storage.get_student(email.upper())["First_name"], "Pat")
+
+        storage.update_student(email.upper(), grade="B")
+        self.assertEqual(storage.get_student(email)["Grade"], "B")
+        storage.delete_student(email)
+        self.assertIsNone(storage.get_student(email))
+        with self.assertRaises(ValueError):
+            storage.delete_student(email)
+
+    def test_course_index_follows_student_updates(self):
+        email = rand_email("idx")
+        storage.add_student(Student(email, "In", "Dex", "IDX100", "A", 91))
+        storage.update_student(email, course_id="IDX200")
+        self.assertEqual(storage.report_by_course("idx100"), [])
+        self.assertEqual([r["Email_address"] for r in storage.report_by_course("idx200")], [email])
+        self.assertEqual(storage.course_statistics("IDX200")["count"], 1)
+
+        pid = rand_email("prof")
+        storage.add_professor(Professor(pid, "Prof Idx", "Senior", "IDX200"))
+        self.assertEqual(len(storage.report_by_professor(pid)), 1)
+        storage.delete_student(email)
+        self.assertEqual(storage.report_by_professor(pid), [])
+        storage.delete_professor(pid)
+
+    def test_bulk_add_update_delete_and_import(self):
+        emails = [rand_email("bulk") for _ in range(500)]
+        storage.add_students(Student(e, "Bulk", "Load", "BULK100", "B", 85) for e in emails)
+        self.assertEqual(storage.course_statistics("BULK100")["count"], 500)
+
+        # one duplicate rejects the whole batch
+        with self.assertRaises(ValueError):
+            storage.add_students([Student(rand_email("bulk"), "A", "B", "BULK100", "A", 90),
+                                  Student(emails[0].upper(), "A", "B", "BULK100", "A", 90)])
+        self.assertEqual(storage.course_statistics("BULK100")["count"], 500)
+
+        storage.update_students({e: {"marks": 60} for e in emails[:100]})
+        self.assertEqual(storage.get_student(emails[0])["Marks"], "60")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bulk.csv")
+            self.assertGreaterEqual(storage.export_csv("students", path), 500)
+            storage.delete_students(emails)
+            self.assertIsNone(storage.course_statistics("BULK100"))
+            with open(path, newline="", encoding="utf-8") as f:
+                lines = [l for l in f if "@" not in l or "bulk_" in l]
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                f.writelines(lines)
+            self.assertEqual(storage.import_csv("students", path), 500)
+        self.assertEqual(storage.course_statistics("BULK100")["count"], 500)
+        storage.delete_students(emails)
+
+    def test_transaction_commit_and_rollback(self):
+        cid = "TX" + rand_email("c")[2:8].upper()
+        emails = [rand_email("tx") for _ in range(50)]
+        if storage.backend().name == "csv":
+            storage.compact("students")
+            inode = os.stat(storage.FILES["students"]).st_ino
+        with storage.transaction():
+            storage.add_course(Course(cid, "Transactions", "Unit of work", 3))
+            storage.add_students(Student(e, "Tx", "Student", cid, "A", 90) for e in emails)
+            storage.update_student(emails[0], grade="B")
+            # nothing is on disk yet, but reads inside the block see the changes
+            self.assertEqual(storage.get_student(emails[0])["Grade"], "B")
+        if storage.backend().name == "csv":
+            # the commit appended the changes (inserts and an update: to the journal); students.csv was not rewritten
+            self.assertEqual(os.stat(storage.FILES["students"]).st_ino, inode)
+            self.assertTrue(os.path.exists(storage.JOURNALS["students"]))
+        storage.clear_cache()
+        self.assertEqual(storage.course_statistics(cid)["count"], 50)
+        self.assertIsNotNone(storage.get_course(cid))
+
+        with self.assertRaises(RuntimeError):
+            with storage.transaction():
+                storage.delete_students(emails)
+                storage.delete_course(cid)
+                raise RuntimeError("abort")
+        self.assertEqual(storage.course_statistics(cid)["count"], 50)
+        self.assertIsNotNone(storage.get_course(cid))
+        storage.delete_students(emails)
+        storage.delete_course(cid)
+
+        if storage.backend().name == "csv":
+            # the students journal cannot be written: the course appended just before it is taken back
+            storage.compact("students")
+            size = os.path.getsize(storage.FILES["courses"])
+            os.mkdir(storage.JOURNALS["students"])
+            try:
+                with self.assertRaises(OSError):
+                    with storage.transaction():
+                        storage.add_course(Course(cid, "Transactions", "Unit of work", 3))
+                        storage.add_student(Student(emails[0], "Tx", "Student", cid, "A", 90))
+                        storage.update_student(emails[0], grade="B")
+            finally:
+                os.rmdir(storage.JOURNALS["students"])
+            self.assertEqual(os.path.getsize(storage.FILES["courses"]), size)
+            storage.clear_cache()
+            self.assertIsNone(storage.get_course(cid))
+            self.assertIsNone(storage.get_student(emails[0]))
+
+    def test_sqlite_backend(self):
+        previous = storage.backend().name
+        with tempfile.TemporaryDirectory() as tmp:
+            counts = storage.migrate_to_sqlite(os.path.join(tmp, "migrated.db"))
+            self.assertEqual(counts["grades"], len(storage.backend().rows("grades")))
+
+            storage.use_backend("sqlite", os.path.join(tmp, "test.db"))
+            try:
+                email = rand_email("sql")
+                storage.add_student(Student(email, "Sq", "Lite", "SQL100", "A", 93))
+                with self.assertRaises(ValueError):
+                    storage.add_student(Student(email.upper(), "Sq", "Lite", "SQL100", "A", 93))
+                storage.update_student(email, course_id="SQL200", marks=88)
+                self.assertEqual(storage.report_by_course("SQL100"), [])
+                self.assertEqual(storage.report_by_course("sql200")[0]["Marks"], "88")
+                with self.assertRaises(RuntimeError):
+                    with storage.transaction():
+                        storage.delete_student(email)
+                        raise RuntimeError("abort")
+                self.assertIsNotNone(storage.get_student(email))
+
+                # another process adds the same email between our check and our insert: its row is kept
+                other = storage._open_sqlite(os.path.join(tmp, "test.db"))
+                dup = rand_email("sql")
+                row = {"Email_address": dup, "First_name": "Other", "Last_name": "Process", "Course_id": "SQL100",
+                       "Grade": "A", "Marks": "90.00"}
+                version = storage.backend().version("students")
+                self.assertIsNone(storage.get_student(dup))
+                other.apply("students", [("I", row)])
+                mine = [("I", dict(row, First_name="Mine"))]
+                with self.assertRaises(storage.ConflictError):
+                    storage.backend().apply("students", mine, expected=version)
+                with self.assertRaises(storage.ConflictError):
+                    storage.backend().apply("students", mine)
+                with self.assertRaises(ValueError):
+                    storage.add_student(Student(dup, "Mine", "", "SQL100", "A", 90))
+                self.assertEqual(storage.get_student(dup)["First_name"], "Other")
+                other.close()
+            finally:
+                storage.use_backend(previous)
+
+    def test_partitioned_backend(self):
+        previous = storage.backend().name
+        with tempfile.TemporaryDirectory() as tmp:
+            shards = os.path.join(tmp, "students")
+            be = storage.use_backend("partitioned", shards)
+            try:
+                self.assertEqual(storage.count("students"), len(storage.CsvBackend().rows("students")))
+                emails = [rand_email("part") for _ in range(3)]
+                storage.add_students([Student(emails[0], "Pa", "A", "PRT100", "A", 90),
+                                      Student(emails[1], "Pa", "B", "PRT100", "B", 80),
+                                      Student(emails[2], "Pa", "C", "PRT/200", "C", 70)])
+                files = {i["course_id"]: i["file"] for i in be._info().values()}
+                self.assertEqual((files["PRT100"], files["PRT/200"]), ("PRT100.csv", "PRT_200.csv"))
+                other = os.path.join(shards, files["PRT/200"])
+                before = os.stat(other).st_mtime_ns
+                storage.update_student(emails[0], marks=95)
+                self.assertEqual(os.stat(other).st_mtime_ns, before)  # the other course's file was not touched
+                self.assertEqual(storage.course_statistics("prt100")["max"], 95)
+
+                storage.update_student(emails[1], course_id="PRT/200")
+                self.assertEqual(len(storage.report_by_course("PRT/200")), 2)
+                self.assertEqual(storage.get_student(emails[1].upper())["Course_id"], "PRT/200")
+                with self.assertRaises(RuntimeError):
+                    with storage.transaction():
+                        storage.delete_student(emails[2])
+                        raise RuntimeError("abort")
+                self.assertIsNotNone(storage.get_student(emails[2]))
+
+                parallel = be.map_shards(partitioned_backend._shard_statistics, (), workers=2)
+                self.assertEqual(parallel["prt/200"]["count"], 2)
+                be.parallel_after = 0
+                self.assertEqual(storage.all_course_statistics()["PRT100"]["count"], 1)
+                self.assertEqual(be.export_courses(os.path.join(tmp, "out"))["PRT100"], 1)
+                storage.delete_students(emails)
+                self.assertNotIn("prt100", be._info())
+                self.assertFalse(os.path.exists(other))
+
+                # all or nothing: when the courses table fails its commit, the student is not saved either
+                cid = "PRT" + rand_email("c")[2:6].upper()
+                with self.assertRaises(storage.ConflictError):
+                    with storage.transaction():
+                        storage.add_student(Student(emails[0], "Pa", "A", "PRT300", "A", 90))
+                        storage.add_course(Course(cid, "Partitioned", "", 3))
+                        with open(storage.FILES["courses"], "a", newline="", encoding="utf-8") as f:
+                            f.write("OTHER_WRITER,x,x,1\r\n")  # another process writes courses.csv meanwhile
+                storage.clear_cache()
+                self.assertIsNone(storage.get_student(emails[0]))
+                self.assertIsNone(storage.get_course(cid))
+                storage.delete_course("OTHER_WRITER")
+
+                # a second process with an older manifest adds a shard; the first one's shard is kept
+                second = partitioned_backend.PartitionedBackend(shards, storage.HEADERS, storage.KEYS,
+                                                                storage.CsvBackend())
+                second.count("students")
+                storage.add_student(Student(emails[0], "Pa", "A", "PRT400", "A", 90))
+                second.apply("students", [("I", {"Email_address": emails[1], "First_name": "Pa", "Last_name": "B",
+                                                "Course_id": "PRT500", "Grade": "B", "Marks": "80.00"})])
+                storage.clear_cache()
+                self.assertEqual(storage.get_student(emails[0])["Course_id"], "PRT400")
+                self.assertEqual(storage.get_student(emails[1])["Course_id"], "PRT500")
+                storage.delete_students(emails[:2])
+            finally:
+                storage.use_backend(previous)
+
+    def test_query_planner(self):
+        cid = "QRY" + rand_email("c")[2:6].upper()
+        emails = [rand_email("q") for _ in range(20)]
+        storage.add_students(Student(e, "Query", f"Last{i}", cid, "B", 50 + i) for i, e in enumerate(emails))
+
+        q = eq("Course_id", cid.lower()) & between("Marks", 60, 65)
+        self.assertEqual(storage.explain("students", q), "index Course_id")
+        rows, _ = storage.search_students(q, order_by="Marks", reverse=True)
+        self.assertEqual([float(r["Marks"]) for r in rows], [65, 64, 63, 62, 61, 60])
+
+        self.assertEqual(storage.explain("students", eq("Email_address", emails[3])), "primary key")
+        q = any_of(eq("Email_address", emails[3]), eq("Email_address", emails[4].upper()))
+        self.assertEqual(len(storage.search_students(q)[0]), 2)
+        self.assertEqual(storage.explain("students", contains("Grade", "b")), "scan")
+        rows, _ = storage.search_students(eq("Course_id", cid) & prefix("Last_name", "last1"), limit=3)
+        self.assertEqual(len(rows), 3)
+        # the lambda form still works
+        rows, _ = storage.search_students(lambda r: r["Course_id"] == cid, limit=5)
+        self.assertEqual(len(rows), 5)
+        storage.delete_students(emails)
+
+    def test_trigram_search_follows_updates(self):
+        email = rand_email("tri")
+        storage.add_student(Student(email, "Zebulon", "Quaxley", "TRI100", "A", 90))
+        q = any_of(contains("First_name", "bulo"), contains("Last_name", "bulo"),
+                   contains("Email_address", "bulo"), contains("Course_id", "bulo"))
+        self.assertTrue(storage.explain("students", q).startswith("union(text index"))
+        self.assertEqual([r["Email_address"] for r in storage.search_students(q)[0]], [email])
+
+        storage.update_student(email, first_name="Ezekiel")
+        self.assertEqual(storage.search_students(q)[0], [])
+        self.assertEqual(len(storage.search_students(contains("First_name", "ZEKI"))[0]), 1)
+        storage.delete_student(email)
+        self.assertEqual(storage.search_students(contains("Last_name", "quaxl"))[0], [])
+
+    def test_sorted_pages_follow_updates(self):
+        cid = "TOP" + rand_email("c")[2:6].upper()
+        full, _ = storage.sort_students(by="Marks", reverse=True)
+        page, _ = storage.sort_students(by="Marks", reverse=True, limit=10, offset=5)
+        self.assertEqual([r["Marks"] for r in page], [r["Marks"] for r in full[5:15]])
+
+        email = rand_email("top")
+        storage.add_student(Student(email, "Top", "Scorer", cid, "A", 100.5))
+        top, _ = storage.sort_students(by="Marks", reverse=True, limit=1)
+        self.assertEqual(top[0]["Email_address"], email)
+        storage.update_student(email, marks=-1)
+        bottom, _ = storage.sort_students(by="Marks", limit=1)
+        self.assertEqual(bottom[0]["Email_address"], email)
+        storage.delete_student(email)
+        bottom, _ = storage.sort_students(by="Marks", limit=1)
+        self.assertNotEqual(bottom[0]["Email_address"], email)
+
+    def test_course_statistics_single_pass(self):
+        cid = "STA" + rand_email("c")[2:6].upper()
+        marks = [60, 70, 80, 90]
+        emails = [rand_email("sta") for _ in marks]
+        storage.add_students(Student(e, "Stat", "S", cid, "ABCD"[i], m) for i, (e, m) in enumerate(zip(emails, marks)))
+        st = storage.course_statistics(cid, percentiles=(25, 100))
+        self.assertEqual((st["count"], st["average"], st["median"]), (4, 75, 75))
+        self.assertAlmostEqual(st["stddev"], 11.1803398875)
+        self.assertEqual((st["min"], st["max"]), (60, 90))
+        self.assertEqual(st["percentiles"], {25: 67.5, 100: 90})
+        self.assertEqual(st["grades"], {"A": 1, "B": 1, "C": 1, "D": 1})
+        self.assertEqual(storage.all_course_statistics()[cid], storage.course_statistics(cid))
+        storage.delete_students(emails)
+
+    def test_course_aggregates_follow_updates(self):
+        a, b = "AGA" + rand_email("c")[2:6].upper(), "AGB" + rand_email("c")[2:6].upper()
+        emails = [rand_email("agg") for _ in range(3)]
+        storage.add_students(Student(e, "Agg", "S", a, "B", m) for e, m in zip(emails, [70, 80, 90]))
+        self.assertEqual(storage.course_statistics(a)["median"], 80)
+
+        storage.update_student(emails[1], marks=100, grade="A")
+        st = storage.course_statistics(a)
+        self.assertEqual((st["median"], st["max"], st["grades"]), (90, 100, {"A": 1, "B": 2}))
+        storage.update_student(emails[0], course_id=b)
+        self.assertEqual(storage.course_statistics(a)["count"], 2)
+        self.assertEqual(storage.course_statistics(b)["average"], 70)
+        storage.delete_students(emails)
+        self.assertIsNone(storage.course_statistics(a))
+        self.assertNotIn(b, storage.all_course_statistics())
+
+    @unittest.skipUnless(storage.backend().name == "csv", "in-memory rows of the CSV backend")
+    def test_compact_student_rows(self):
+        emails = [rand_email("row") for _ in range(2)]
+        storage.add_students([Student(emails[0], "Row", "A", "ROW100", "B", 81.5),
+                              Student(emails[1], "Row", "B", "ROW100", "C", 70)])
+        first, second = storage._find("students", emails[0]), storage._find("students", emails[1])
+        self.assertIsInstance(first, StudentRow)
+        self.assertIs(first.Course_id, second.Course_id)
+        self.assertEqual(first.marks, 81.5)
+
+        storage.update_student(emails[0], marks=77)
+        self.assertEqual(storage.get_student(emails[0])["Marks"], "77")
+        self.assertEqual(storage.get_student(emails[1]),
+                         {"Email_address": emails[1], "First_name": "Row", "Last_name": "B",
+                          "Course_id": "ROW100", "Grade": "C", "Marks": "70.00"})
+        rows, _ = storage.sort_students(by="Marks", reverse=True)
+        self.assertEqual(rows[0]["Marks"], max(rows, key=lambda r: float(r["Marks"]))["Marks"])
+        storage.delete_students(emails)
+
+    def test_streaming_readers(self):
+        emails = [rand_email("iter") for _ in range(3)]
+        storage.add_students(Student(e, "Iter", "S", "ITR100", "A", 90) for e in emails)
+        it = storage.iter_students()
+        first = next(it)
+        first["First_name"] = "changed"
+        it.close()
+        self.assertNotEqual(storage.get_student(first["Email_address"])["First_name"], "changed")
+        streamed = [r["Email_address"] for r in storage.iter_table("students")]
+        self.assertEqual(streamed, [r["Email_address"] for r in storage._read_all("students")])
+        self.assertEqual(len(storage.select("students", limit=2)), 2)
+        with self.assertRaises(ValueError):
+            next(storage.iter_table("nope"))
+
+        if storage.backend().name == "csv":
+            storage.compact("students")
+            storage.clear_cache()
+            results, _ = storage.search_students(lambda r: r["Course_id"] == "ITR100", limit=1)
+            self.assertEqual(len(results), 1)
+            self.assertNotIn("students", storage.cache_stats()["tables"])  # answered without loading the table
+            self.assertEqual((storage.cache_stats()["streams"], storage.cache_stats()["misses"]), (1, 1))
+            # only the first read of this version streams; the next one loads the table for the calls after it
+            self.assertEqual(storage.get_student(emails[1])["Course_id"], "ITR100")
+            self.assertIn("students", storage.cache_stats()["tables"])
+            hits = storage.cache_stats()["hits"]
+            storage.report_by_student(emails[2])
+            storage.search_students(lambda r: r["Course_id"] == "ITR100")
+            self.assertEqual(storage.cache_stats()["hits"], hits + 2)
+            self.assertEqual(storage.cache_stats()["streams"], 1)
+        storage.delete_students(emails)
+
+    def test_binary_student_store(self):
+        rows = [{"Email_address": "Bin1@x.com", "First_name": "Bin", "Last_name": "One", "Course_id": "DATA200",
+                 "Grade": "A", "Marks": "95.50"},
+                {"Email_address": "bin2@x.com", "First_name": "Bín", "Last_name": "Two", "Course_id": "DATA200",
+                 "Grade": "C", "Marks": "71.00"}]
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "students.bin")
+            self.assertEqual(binstore.write(path, rows), 2)
+            size = os.path.getsize(path)
+            with binstore.BinaryStudents(path, writable=True) as store:
+                self.assertEqual(len(store), 2)
+                self.assertEqual(list(store), rows)
+                self.assertEqual(store.find("bin1@X.com"), 0)
+                self.assertIsNone(store.find("missing@x.com"))
+                self.assertEqual(store.field(1, "First_name"), "Bín")
+                self.assertEqual(list(store.iter_marks()), [95.5, 71.0])
+                store.set_marks(1, 88)
+                store.set_grade(1, "B+")
+                with self.assertRaises(ValueError):
+                    store.set_grade(1, "too long")
+            self.assertEqual(os.path.getsize(path), size)
+            with binstore.BinaryStudents(path) as store:
+                self.assertEqual((store.row(1)["Marks"], store.row(1)["Grade"]), ("88.00", "B+"))
+                with self.assertRaises(IndexError):
+                    store.marks(2)
+
+            out = os.path.join(d, "students.csv")
+            self.assertEqual(binstore.to_csv(path, out), 2)
+            self.assertEqual(binstore.to_binary(os.path.join(d, "again.bin"), out), 2)
+            with open(os.path.join(d, "bad.bin"), "wb") as f:
+                f.write(b"not a students file")
+            with self.assertRaises(ValueError):
+                binstore.BinaryStudents(os.path.join(d, "bad.bin"))
+
+            # round trip through the students table: pending changes are in the binary copy, and writing it back
+            # only changes what was changed in it
+            email, gone = rand_email("bin"), rand_email("bin")
+            storage.add_students([Student(email, "Bin", "Three", "BIN100", "A", 90),
+                                  Student(gone, "Bin", "Four", "BIN100", "A", 90)])
+            storage.update_student(email, marks=91)
+            storage.delete_student(gone)
+            before = storage.count("students")
+            table = os.path.join(d, "table.bin")
+            self.assertEqual(binstore.to_binary(table), before)
+            with binstore.BinaryStudents(table, writable=True) as store:
+                self.assertEqual(store.row(store.find(email))["Marks"], "91.00")
+                store.set_marks(store.find(email), 75)
+            self.assertEqual(binstore.to_csv(table), before)
+            self.assertEqual(storage.count("students"), before)
+            self.assertIsNone(storage.get_student(gone))
+            self.assertEqual(storage.get_student(email)["Marks"], "75.00")
+            storage.delete_student(email)
+
+    def test_external_merge_sort(self):
+        rows = [{"Email_address": f"e{i}@x.com", "Last_name": random.choice(["b", "A", "c", "a"]),
+                 "Marks": f"{random.randint(0, 20)}"} for i in range(257)]
+        rows.append({"Email_address": "bad@x.com", "Last_name": "z", "Marks": "n/a"})
+        for by, numeric in (("Marks", True), ("Last_name", False)):
+            for reverse in (False, True):
+                expected = sorted(rows, key=storage.sort_key(by, numeric), reverse=reverse)
+                self.assertEqual(list(extsort.sort_rows(rows, by, numeric, reverse, run_size=10)), expected)
+        it = extsort.sort_rows(rows, "Marks", True, run_size=10)
+        next(it)
+        it.close()  # the temporary runs are removed
+        self.assertEqual(list(extsort.sort_rows([], "Marks", True, run_size=10)), [])
+
+        old = storage.EXTERNAL_SORT_AFTER
+        storage.EXTERNAL_SORT_AFTER = 7
+        try:
+            streamed = [float(r["Marks"]) for r in storage.iter_sorted("students", "Marks", reverse=True)]
+        finally:
+            storage.EXTERNAL_SORT_AFTER = old
+        in_memory, _ = storage.sort_students(by="Marks", reverse=True)
+        # sort_students orders equal marks by email, the merge keeps table order, so compare the marks only
+        self.assertEqual(streamed, [float(r["Marks"]) for r in in_memory])
+        with tempfile.TemporaryDirectory() as d:
+            self.assertEqual(storage.export_sorted("courses", os.path.join(d, "c.csv"), "Course_id"),
+                             storage.count("courses"))
+        with self.assertRaises(ValueError):
+            next(storage.iter_sorted("students", "Nope"))
+
+    def test_seed_grades_only_missing(self):
+        gid = "SEED" + rand_email("g")[2:6].upper()
+        scale = [Grade(gid, "A", "90-100"), Grade(gid + "B", "B", "80-89")]
+        self.assertEqual(storage.seed_grades(scale[:1]), 1)
+        self.assertEqual(storage.seed_grades(scale), 1)
+        self.assertEqual(storage.seed_grades(scale), 0)
+        self.assertEqual(storage.get_grade(gid + "b")["Marks_range"], "80-89")
+        storage.delete_grade(gid)
+        storage.delete_grade(gid + "B")
+
+    @unittest.skipUnless(storage.backend().name == "csv", "CSV backend only")
+    def test_table_snapshot(self):
+        email = rand_email("snap")
+        storage.add_student(Student(email, "Snap", "Shot", "SNP100", "A", 91))
+        storage.update_student(email, marks=77)  # goes to the journal, which the snapshot must include
+        before = storage._read_all("students")
+        storage._save_snapshots()
+        storage.clear_cache()
+        self.assertIsNotNone(storage._read_snapshot("students", storage._table_signature("students")))
+        self.assertEqual(storage._read_all("students"), before)
+        self.assertEqual(storage.get_student(email)["Marks"], "77")
+
+        storage.delete_student(email)  # the files change, so the old snapshot no longer matches
+        self.assertIsNone(storage._read_snapshot("students", storage._table_signature("students")))
+        storage.clear_cache()
+        self.assertIsNone(storage.get_student(email))
+
+    def test_batch_mode(self):
+        cid = "BAT" + rand_email("c")[2:6].upper()
+        emails = [rand_email("batch") for _ in range(3)]
+        ops = [{"op": "add_student", "email_address": e, "first_name": "Ba", "last_name": "Tch", "course_id": cid,
+                "grade": "B", "marks": 80 + i} for i, e in enumerate(emails)]
+        ops += [{"op": "add_student", "email_address": emails[0], "first_name": "Dup", "last_name": "", "course_id": cid,
+                 "grade": "B", "marks": 1},
+                {"op": "count", "key": "students", "id": "n"},
+                {"op": "update_student", "email": emails[1], "marks": 99},
+                {"op": "select", "table": "students", "where": {"eq": {"Course_id": cid}, "between": {"Marks": [90, 100]}}},
+                {"op": "nope"}]
+        lines = [json.dumps(o) for o in ops] + ["", "{bad json"] + [json.dumps({"op": "delete_student", "email": e}) for e in emails]
+        out = io.StringIO()
+        counts = batch.run(lines, out)
+        results = [json.loads(l) for l in out.getvalue().splitlines()]
+        self.assertEqual(counts, {"ops": 12, "errors": 3})
+        self.assertEqual([r["op"] for r in results if r["op"] == "commit"], ["commit", "commit"])
+        self.assertEqual(results[4]["lines"], [1, 4])  # the four adds were saved in one transaction
+        self.assertFalse(results[3]["ok"])
+        self.assertEqual(results[5]["id"], "n")
+        self.assertEqual(results[7]["result"][0]["Email_address"], emails[1])
+        self.assertIn("Unknown op", results[8]["error"])
+        self.assertTrue(all("ms" in r for r in results))
+        self.assertEqual(storage.report_by_course(cid), [])
+
+    @unittest.skipUnless(storage.backend().name == "csv", "CSV backend only")
+    def test_version_check(self):
+        cid = "VER" + rand_email("c")[2:6].upper()
+        version = storage.backend().version("courses")
+        storage.add_course(Course(cid, "Versions", "Optimistic checks", 3))
+        self.assertNotEqual(storage.backend().version("courses"), version)
+        with self.assertRaises(storage.ConflictError):
+            storage.backend().apply("courses", [("D", {"Course_id": cid})], expected=version)
+        self.assertIsNotNone(storage.get_course(cid))
+        storage.delete_course(cid)
+
+    def test_concurrent_writers(self):
+        # three processes add courses at the same time, half of them through transactions (checked and written at
+        # commit); with the locks and version checks none of the rows is lost
+        base = "CC" + rand_email("c")[2:6].upper()
+        worker = (
+            "import sys, storages as storage\n"
+            "from models import Course\n"
+            "n = sys.argv[1]\n"
+            "for i in range(20):\n"
+            "    cid = f'" + base + "{n}_{i}'\n"
+            "    if i % 2:\n"
+            "        storage.add_course(Course(cid, 'Concurrent', '', 3))\n"
+            "        continue\n"
+            "    while True:\n"
+            "        try:\n"
+            "            with storage.transaction():\n"
+            "                storage.add_course(Course(cid, 'Concurrent', '', 3))\n"
+            "            break\n"
+            "        except storage.ConflictError:\n"
+            "            pass\n"
+        )
+        root = os.path.dirname(os.path.abspath(storage.__file__))
+        procs = [subprocess.Popen([sys.executable, "-c", worker, str(n)], cwd=root) for n in range(3)]
+        self.assertEqual([p.wait(timeout=120) for p in procs], [0, 0, 0])
+        storage.clear_cache()
+        ids = [c["Course_id"] for c in storage.select("courses", prefix("Course_id", base))]
+        self.assertEqual(len(ids), 60)
+        for cid in ids:
+            storage.delete_course(cid)
+
+    def test_concurrent_student_writers(self):
+        # six processes add, update, delete and re-add students at the same time, without transactions: every
+        # change waits for the table's write lock, so none fails and none is lost
+        base = "cw" + rand_email("c")[2:6]
+        worker = (
+            "import sys, storages as storage\n"
+            "from models import Student\n"
+            "n = sys.argv[1]\n"
+            "for i in range(30):\n"
+            "    e = f'" + base + "{n}_{i}@example.com'\n"
+            "    storage.add_student(Student(e, 'Con', n, f'CW{i % 3}', 'B', 70))\n"
+            "    if i % 3 == 0:\n"
+            "        storage.update_student(e, marks=99)\n"
+            "    if i % 5 == 4:\n"
+            "        storage.delete_student(e)\n"
+            "        storage.add_student(Student(e, 'Con', n, f'CW{i % 3}', 'B', 71))\n"
+        )
+        root = os.path.dirname(os.path.abspath(storage.__file__))
+        procs = [subprocess.Popen([sys.executable, "-c", worker, str(n)], cwd=root) for n in range(6)]
+        self.assertEqual([p.wait(timeout=300) for p in procs], [0] * 6)
+        storage.clear_cache()
+        rows = storage.select("students", prefix("Email_address", base))
+        self.assertEqual(len(rows), 180)
+        updated = 6 * sum(1 for i in range(30) if i % 3 == 0 and i % 5 != 4)  # not re-added afterwards
+        self.assertEqual(sum(r["Marks"].startswith("99") for r in rows), updated)
+        storage.delete_students(r["Email_address"] for r in rows)
+
+    def test_server_and_load(self):
+        cid = "SRV" + rand_email("c")[2:6].upper()
+        email = rand_email("srv")
+        with server.background(group_max=50) as srv:
+            with server.Client(srv.address) as c:
+                c.call("add_student", email_address=email, first_name="Ser", last_name="Ver", course_id=cid,
+                       grade="A", marks=91)
+                self.assertEqual(c.call("get_student", email=email.upper())["Marks"], "91.00")
+                with self.assertRaises(ValueError):
+                    c.call("add_student", email_address=email, first_name="", last_name="", course_id=cid,
+                           grade="A", marks=1)
+                self.assertFalse(c.request({"op": "nope"})["ok"])
+                # the local stand-in for many operators: 6 connections at once, a quarter of the requests are writes
+                result = server.load(srv.address, clients=6, ops=40, course=cid)
+                self.assertEqual(result["ops"], 240)
+                self.assertEqual(result["errors"], 0)
+                counters = c.call("server_stats")
+                self.assertGreaterEqual(counters["connections"], 7)
+                self.assertLessEqual(counters["write_groups"], counters["writes"])
+                self.assertEqual(c.call("count", key="students"), storage.count("students"))
+                c.call("delete_student", email=email)
+        self.assertEqual(storage.report_by_course(cid), [])
+
+    def test_benchmark_suite(self):
+        before = storage.count("students")
+        results = bench.run(["300"], repeat=3)
+        ops = results["results"]["300"]
+        for op in ("load", "add_student", "update_student", "sort_all", "report_by_professor", "delete_student"):
+            self.assertGreater(ops[op]["calls"], 0)
+            self.assertGreater(ops[op]["ops_per_second"], 0)
+            self.assertGreater(ops[op]["peak_kb"], 0)
+        self.assertEqual(bench.compare(results, results), [])
+        faster = json.loads(json.dumps(results))
+        faster["results"]["300"]["get_student"]["ops_per_second"] *= 10
+        self.assertEqual(len(bench.compare(results, faster)), 1)
+        self.assertEqual(storage.count("students"), before)  # generated data lives in a temporary folder
+
+    def test_operation_metrics(self):
+        metrics.reset()
+        email = rand_email("met")
+        storage.add_student(Student(email, "Met", "Rics", "MET100", "A", 90))
+        with self.assertRaises(ValueError):
+            storage.add_student(Student(email, "Met", "Rics", "MET100", "A", 90))
+        rows, _ = storage.search_students(contains("Email_address", email))
+        self.assertEqual(len(rows), 1)
+        ops = storage.performance()["operations"]
+        self.assertEqual((ops["add_student"]["count"], ops["add_student"]["errors"]), (2, 1))
+        self.assertEqual(ops["search_students"]["rows_returned"], 1)
+        storage.get_student(email)
+        storage.get_student(rand_email("missing"))
+        storage.course_statistics("MET100")
+        ops = storage.performance()["operations"]
+        self.assertEqual((ops["get_student"]["count"], ops["get_student"]["rows_returned"]), (2, 1))
+        self.assertEqual(ops["course_statistics"]["rows_returned"], 0)
+        self.assertEqual(ops["select"]["count"], 1)  # called by search_students, counted for both
+        self.assertEqual(sum(ops["add_student"]["histogram"]), 2)
+        if storage.backend().name == "csv":
+            self.assertGreater(ops["add_student"]["bytes_written"], 0)
+            self.assertIsNotNone(storage.performance()["cache"]["hit_rate"])
+
+        metrics.start_profiling(slower_than_ms=0)
+        try:
+            storage.delete_student(email)
+        finally:
+            captured = metrics.stop_profiling()
+        self.assertEqual([p["op"] for p in captured], ["delete_student"])
+        self.assertIn("function calls", captured[0]["top"])
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.dump(os.path.join(tmp, "metrics.json"))
+            with open(os.path.join(tmp, "metrics.json")) as f:
+                self.assertEqual(json.load(f)["operations"]["delete_student"]["count"], 1)
+
+    def test_join_and_roster_views(self):
+        cid, other = ("RV" + rand_email("c")[2:6].upper() + n for n in ("A", "B"))
+        pid = rand_email("prof")
+        emails = [rand_email("rv") for _ in range(3)]
+        storage.add_course(Course(cid, "Rosters", "Views", 3))
+        storage.add_course(Course(other, "Other", "Views", 4))
+        storage.add_professor(Professor(pid, "Pat Roster", "Senior", cid))
+        storage.add_students(Student(e, "Ro", "Ster", cid, "A", 90 + i) for i, e in enumerate(emails))
+
+        joined = storage.join_tables("students", "courses", "Course_id", where=eq("Course_id", cid))
+        self.assertEqual([r["Course_name"] for r in joined], ["Rosters"] * 3)
+        self.assertEqual(len(storage.join_tables("professors", "courses", "Course_id", where=eq("Professor_id", pid))), 1)
+        with self.assertRaises(ValueError):
+            storage.join_tables("students", "nope", "Course_id")
+
+        def rosters():
+            return storage.course_roster(cid), storage.course_roster(other), storage.professor_roster(pid)
+
+        without = rosters()
+        self.assertEqual(without[0][0]["Professor_Name"], "Pat Roster")
+        storage.use_views()
+        try:
+            view = storage._views
+            self.assertEqual(rosters(), without)
+            builds = view.builds
+            # every change is applied to the view, which then gives what a fresh join gives
+            storage.update_student(emails[0], course_id=other)
+            storage.delete_student(emails[1])
+            storage.update_course(cid, course_name="Rosters II")
+            storage.add_professor(Professor(pid + "x", "Sam Second", "Junior", cid))
+            storage.update_professor(pid, course_id=other)
+            with self.assertRaises(RuntimeError):
+                with storage.transaction():
+                    storage.delete_student(emails[2])
+                    raise RuntimeError("abort")
+            with_views = rosters()
+            self.assertEqual(view.builds, builds + 1)  # the rollback threw the view away once, nothing else did
+            storage.use_views(False)
+            self.assertEqual(with_views, rosters())
+            self.assertEqual([r["Email_address"] for r in with_views[1]], [emails[0]])
+            self.assertEqual(with_views[0][0]["Course_name"], "Rosters II")
+            self.assertEqual(with_views[0][0]["Professor_Name"], "Sam Second")
+            self.assertEqual({r["Professor_Name"] for r in with_views[2]}, {"Pat Roster"})
+        finally:
+            storage.use_views(False)
+        storage.delete_students([emails[0], emails[2]])
+        storage.delete_professor(pid)
+        storage.delete_professor(pid + "x")
+        storage.delete_course(cid)
+        storage.delete_course(other)
+
+    def test_roster_view_matches_fresh_join(self):
+        rnd = random.Random(7)
+        tag = rand_email("c")[2:6].upper()
+        courses = [f"RJ{tag}{n}" for n in range(3)]
+        profs = [rand_email("rjp") for _ in range(4)]
+        emails = [rand_email("rj") for _ in range(8)]
+        for c in courses:
+            storage.add_course(Course(c, "Join", "Views", 3))
+
+        def fresh(course_id):
+            view, storage._views = storage._views, None
+            try:
+                return storage.course_roster(course_id)
+            finally:
+                storage._views = view
+
+        storage.use_views()
+        try:
+            for step in range(300):
+                e, p, c = rnd.choice(emails), rnd.choice(profs), rnd.choice(courses)
+                kind = rnd.randrange(6)
+                if kind == 0 and storage.get_student(e) is None:
+                    storage.add_student(Student(e, "Rj", str(step), c, "B", rnd.uniform(50, 100)))
+                elif kind == 1 and storage.get_student(e) is not None:
+                    # a marks-only change, a move, or the same course in other letters
+                    storage.update_student(e, **rnd.choice([{"marks": rnd.uniform(50, 100)}, {"course_id": c},
+                                                            {"course_id": storage.get_student(e)["Course_id"].lower()}]))
+                elif kind == 2 and storage.get_student(e) is not None:
+                    storage.delete_student(e)
+                elif kind == 3 and storage.get_professor(p) is None:
+                    storage.add_professor(Professor(p, f"Prof {step}", "Senior", c))
+                elif kind == 4 and storage.get_professor(p) is not None:
+                    storage.update_professor(p, **rnd.choice([{"course_id": c}, {"name": f"Prof {step}"}]))
+                elif kind == 5:
+                    storage.update_course(c, course_name=f"Join {step}")
+                if step % 25 == 24:
+                    for course in courses:
+                        self.assertEqual(storage.course_roster(course), fresh(course), f"step {step}")
+        finally:
+            storage.use_views(False)
+        for e in emails:
+            if storage.get_student(e) is not None:
+                storage.delete_student(e)
+        for p in profs:
+            if storage.get_professor(p) is not None:
+                storage.delete_professor(p)
+        for c in courses:
+            storage.delete_course(c)
+
+    def test_columnar_analytics(self):
+        rows = [{"Email_address": f"a{i}@x.com", "First_name": "", "Last_name": "", "Course_id": c, "Grade": "", "Marks": m}
+                for i, (c, m) in enumerate([("C1", "95"), ("c1", "85"), ("C1", "85"), ("C2", "55.5"), ("C2", "bad")])]
+        cols = analytics.load(rows)
+        self.assertEqual(len(cols), 4)
+        by_course = analytics.course_stats(cols)
+        self.assertEqual(by_course["C1"]["count"], 3)
+        self.assertEqual(by_course["C1"]["median"], 85)
+        self.assertAlmostEqual(by_course["C1"]["average"], 88.3333333333)
+        self.assertEqual(by_course["C2"]["min"], 55.5)
+        self.assertEqual(analytics.rank(cols), [1, 2, 2, 4])
+        letters, counts = analytics.bucket(cols, [(0, "F"), (60, "D"), (90, "A")])
+        self.assertEqual(letters, ["A", "D", "D", "F"])
+        self.assertEqual(counts, {"F": 1, "D": 2, "A": 1})
+        self.assertEqual(analytics.histogram(cols, bins=2, low=50, high=100)[0], [1, 3])
+
+        st = analytics.course_stats(analytics.load())["DATA200"]
+        expected = storage.course_statistics("DATA200")
+        self.assertEqual(st["count"], expected["count"])
+        self.assertAlmostEqual(st["median"], expected["median"])
+
 
 if __name__ == "__main__":
     unittest.main() 
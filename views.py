@@ -0,0 +1,129 @@
+"""Materialized roster views: the roster rows of every course (see join.roster), kept ready in memory.
+
+Without the view a roster report looks up the course, its professors and its students and joins them on
+every call. With it (storages.use_views(), or CHECKMYGRADE_VIEWS=1) the rows are built once with a hash join
+over the three tables and then a roster is a dictionary lookup.
+
+The view follows every change made through storages: apply() receives the same (op, row) changes the
+backend got and only touches what they affect. A student change moves or rewrites that one row, a course
+change rewrites the course columns of that course's rows, a professor change rewrites the professor columns
+of the courses it left and joined. The versions of the three tables (Backend.version) are remembered after
+each change; if a table has another version when the view is read (another process wrote it), the whole view
+is built again. Backends without versions (None) cannot tell, so only changes from this process are seen.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import join
+from backend import Backend
+
+TABLES = ("students", "courses", "professors")
+
+
+class RosterView:
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self._rosters: Optional[Dict[str, Dict[str, dict]]] = None   # course -> {email: roster row}
+        self._owner: Dict[str, str] = {}                            # email -> course
+        self._courses: Dict[str, dict] = {}                         # course -> course row
+        self._professors: Dict[str, Dict[str, dict]] = {}           # course -> {professor id: row}
+        self._teaches: Dict[str, str] = {}                          # professor id -> course
+        self._versions: Dict[str, object] = {}
+        self.builds = 0
+
+    def clear(self):
+        self._rosters = None
+
+    # True if no table changed since the view last saw it. changed/before: that table was just written by us,
+    # and before is its version from just before the write.
+    def _fresh(self, changed: Optional[str] = None, before: object = None) -> bool:
+        if self._rosters is None:
+            return False
+        for key in TABLES:
+            version = before if key == changed else self.backend.version(key)
+            if version is not None and version != self._versions.get(key):
+                return False
+        return True
+
+    def _build(self):
+        self._courses = {c["Course_id"].lower(): dict(c) for c in self.backend.iter_rows("courses")}
+        self._professors, self._teaches = {}, {}
+        for p in self.backend.iter_rows("professors"):
+            course, pid = p["Course_id"].lower(), p["Professor_id"].lower()
+            self._professors.setdefault(course, {})[pid] = dict(p)
+            self._teaches[pid] = course
+        self._rosters, self._owner = {}, {}
+        professors = [p for ps in self._professors.values() for p in ps.values()]
+        for row in join.roster(self.backend.iter_rows("students"), self._courses.values(), professors):
+            course, email = row["Course_id"].lower(), row["Email_address"].lower()
+            self._rosters.setdefault(course, {})[email] = row
+            self._owner[email] = course
+        self.sync()
+        self.builds += 1
+
+    def sync(self):
+        """Remembers the current table versions (after changes that were already applied to the view)."""
+        self._versions = {key: self.backend.version(key) for key in TABLES}
+
+    def rows(self, course_id: str) -> List[dict]:
+        """Roster rows of one course (copies), in no fixed order: storages.course_roster sorts them."""
+        if not self._fresh():
+            self._build()
+        return [dict(r) for r in self._rosters.get(course_id.lower(), {}).values()]
+
+    # Incremental refresh
+
+    # changes were just applied to table key, which was at version before (None if unknown).
+    def apply(self, key: str, changes: List[Tuple[str, dict]], before: object = None):
+        if key not in TABLES or self._rosters is None:
+            return
+        if not self._fresh(key, before):
+            self._rosters = None  # someone else wrote the tables too; build again on the next read
+            return
+        changed = {"students": self._student, "courses": self._course, "professors": self._professor}[key]
+        for op, row in changes:
+            changed(op, row)
+        self._versions[key] = self.backend.version(key)
+
+    def _student(self, op: str, row: dict):
+        email = row["Email_address"].lower()
+        old = self._owner.pop(email, None)
+        if old is not None:
+            self._rosters[old].pop(email, None)
+            if not self._rosters[old]:
+                del self._rosters[old]
+        if op == "D":
+            return
+        course = row["Course_id"].lower()
+        professors = list(self._professors.get(course, {}).values())
+        self._rosters.setdefault(course, {})[email] = join.roster_row(row, self._courses.get(course), professors)
+        self._owner[email] = course
+
+    def _course(self, op: str, row: dict):
+        course = row["Course_id"].lower()
+        if op == "D":
+            self._courses.pop(course, None)
+        else:
+            self._courses[course] = dict(row)
+        columns = join.course_columns(self._courses.get(course))
+        for r in self._rosters.get(course, {}).values():
+            r.update(columns)
+
+    def _professor(self, op: str, row: dict):
+        pid = row["Professor_id"].lower()
+        touched = set()
+        old = self._teaches.pop(pid, None)
+        if old is not None:
+            del self._professors[old][pid]
+            if not self._professors[old]:
+                del self._professors[old]
+            touched.add(old)
+        if op != "D":
+            course = row["Course_id"].lower()
+            self._professors.setdefault(course, {})[pid] = dict(row)
+            self._teaches[pid] = course
+            touched.add(course)
+        for course in touched:
+            columns = join.professor_columns(list(self._professors.get(course, {}).values()))
+            for r in self._rosters.get(course, {}).values():
+                r.update(columns)